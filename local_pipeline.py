@@ -0,0 +1,144 @@
+# local_pipeline.py
+#
+# Runs the pipeline.py DAG on this machine: `python pipeline.py --local`.
+# Every step runs as its own process (independent steps side by side, up to
+# --jobs at once) with FIREWATCH_LOCAL_OUTPUT pointing at a cache folder keyed
+# by the hash of its inputs: its script and the repo modules it imports, its
+# parameters and its parents' keys. A step whose folder is already complete is
+# not run again, and neither are its downstream steps unless their own inputs
+# changed. A step that runs again (--force, or new inputs) also re-runs every
+# step downstream of it. Artifacts are passed between steps as paths inside those folders
+# (see scripts/pipeline_utils.py).
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS = os.path.join(ROOT, "scripts")
+sys.path.insert(0, SCRIPTS)
+
+from pipeline_utils import LOCAL_ENV  # noqa: E402
+
+REF = re.compile(r"\$\{(\w+)\.id\}")
+IMPORT = re.compile(r"^\s*(?:from|import)\s+(\w+)", re.MULTILINE)
+DONE = ".done"
+
+
+def source_files(script):
+    # the script plus every scripts/ module it imports, transitively
+    seen, todo = [], [os.path.join(ROOT, script)]
+    while todo:
+        path = todo.pop()
+        if path in seen:
+            continue
+        seen.append(path)
+        with open(path) as f:
+            for module in IMPORT.findall(f.read()):
+                candidate = os.path.join(SCRIPTS, f"{module}.py")
+                if os.path.isfile(candidate):
+                    todo.append(candidate)
+    return sorted(seen)
+
+
+def step_key(step, parent_keys):
+    digest = hashlib.sha256()
+    for path in source_files(step["script"]):
+        digest.update(os.path.relpath(path, ROOT).encode())
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    # parent references hash as the parent's key, not its folder
+    # every parent, including ones no parameter refers to
+    for parent in sorted(step.get("parents") or []):
+        digest.update(parent_keys[parent].encode())
+    params = {
+        name: REF.sub(lambda m: parent_keys[m.group(1)], str(value))
+        for name, value in sorted((step.get("parameter_override") or {}).items())
+    }
+    digest.update(json.dumps(params, sort_keys=True).encode())
+    return digest.hexdigest()[:16]
+
+
+def command(step, outputs):
+    cmd = [sys.executable, os.path.join(ROOT, step["script"])]
+    for name, value in (step.get("parameter_override") or {}).items():
+        value = REF.sub(lambda m: outputs[m.group(1)], str(value))
+        cmd += [f"--{name.split('/', 1)[-1]}", value]
+    return cmd
+
+
+def run_step(step, out, cmd):
+    # runs in a pool thread; the step itself is a separate Python process
+    if os.path.isdir(out):
+        shutil.rmtree(out)  # leftovers of an interrupted run
+    os.makedirs(out)
+    env = dict(os.environ, **{LOCAL_ENV: out})
+    start = time.monotonic()
+    with open(os.path.join(out, "step.log"), "w") as log:
+        code = subprocess.call(cmd, cwd=out, env=env, stdout=log, stderr=subprocess.STDOUT)
+    if code == 0:
+        open(os.path.join(out, DONE), "w").close()
+    return code, time.monotonic() - start
+
+
+def run_local(steps, cache_dir=".pipeline_cache", jobs=2, force=()):
+    """Runs ``steps`` (pipeline.py's STEPS) locally; returns a process exit code."""
+    cache_dir = os.path.abspath(cache_dir)
+    pending = {step["name"]: step for step in steps}
+    unknown = sorted(set(force) - set(pending))
+    if unknown:  # a typo would otherwise serve the step from its cache
+        print(f"❌ --force: unknown step(s) {', '.join(unknown)}; steps are {', '.join(pending)}")
+        return 2
+    keys, outputs, failed = {}, {}, []
+    rerun = set()  # steps run in this invocation: their descendants can't reuse a cache
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        while pending or running:
+            for name, step in list(pending.items()):
+                parents = step.get("parents") or []
+                if any(p in failed for p in parents):
+                    print(f"⏭️  {name}: skipped, a parent step failed")
+                    failed.append(name)
+                    del pending[name]
+                    continue
+                if not all(p in outputs for p in parents):
+                    continue
+                del pending[name]
+                keys[name] = step_key(step, keys)
+                out = os.path.join(cache_dir, f"{name}-{keys[name]}")
+                if name in force or any(p in rerun for p in parents):
+                    rerun.add(name)
+                if name not in rerun and os.path.isfile(os.path.join(out, DONE)):
+                    print(f"✅ {name}: cached ({out})")
+                    outputs[name] = out
+                    continue
+                rerun.add(name)
+                print(f"→ {name}: running (log: {os.path.join(out, 'step.log')})")
+                running[pool.submit(run_step, step, out, command(step, outputs))] = (name, out)
+
+            if not running:
+                if pending:  # parents that never ran: a typo or a cycle in the DAG
+                    for name in pending:
+                        print(f"❌ {name}: unresolved parents {pending[name].get('parents')}")
+                    failed.extend(pending)
+                    pending.clear()
+                continue
+            # loop back as soon as anything finishes, so ready steps start straight away
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, out = running.pop(future)
+                code, elapsed = future.result()
+                if code == 0:
+                    print(f"✅ {name}: done in {elapsed:.0f}s")
+                    outputs[name] = out
+                else:
+                    print(f"❌ {name}: exit code {code} after {elapsed:.0f}s, see {out}/step.log")
+                    failed.append(name)
+
+    print(f"🏁 {len(outputs)} steps ok, {len(failed)} failed or skipped")
+    return 1 if failed else 0
@@ -1,89 +1,146 @@
+import argparse
+
 import urllib3.contrib
 urllib3.contrib.appengine = None
 
-from clearml.automation import PipelineController
-
 EXECUTION_QUEUE = "FireWatchQueue"
 
-pipe = PipelineController(
-    project="AlphaFirewatch",
-    name="Firewatch End-to-End Pipeline",
-    version="0.0.5",
-    add_pipeline_tags=False,
-)
-pipe.set_default_execution_queue(EXECUTION_QUEUE)
+# Each step: ClearML base task + the script it was created from (for local runs)
+STEPS = [
+    # Step 1: Download compressed dataset
+    dict(
+        name="step1_download_zip",
+        base_task_name="Step 1: Download Compressed Dataset",
+        script="scripts/s1_dataset_artifact.py",
+    ),
+    # Step 2: Unzip YOLO Dataset
+    dict(
+        name="step2_unzip",
+        parents=["step1_download_zip"],
+        base_task_name="Step 2: Unzip YOLO Dataset",
+        script="scripts/s2_preprocess_artifact.py",
+        parameter_override={
+            "Args/dataset_task_id": "${step1_download_zip.id}"
+        }
+    ),
+    # Step 3: Fire & Smoke Detection Training
+    dict(
+        name="step3_train",
+        parents=["step2_unzip"],
+        base_task_name="Step 3: Fire and Smoke Detection Training",
+        script="scripts/s3_training.py",
+        parameter_override={
+            "Args/dataset_task_id": "${step2_unzip.id}",
+            "Args/model_arch":      "yolo11n.pt",
+            "Args/epochs":          50,
+            "Args/batch":           50,
+            "Args/imgsz":           640,
+        }
+    ),
+    # Step 4: Hyper‐Parameter Optimization
+    dict(
+        name="step4_hpo",
+        parents=["step3_train", "step2_unzip"],
+        base_task_name="HPO: FireWatch YOLO Tuning",
+        script="scripts/s4_hpo.py",
+        parameter_override={
+            "Args/dataset_task_id":   "${step2_unzip.id}",
+            "Args/train_task_id":     "${step3_train.id}",
+            "Args/num_trials":        4,
+            "Args/epochs":            100,
+            "Args/min_epochs":        5,
+            "Args/time_limit_minutes": 60,
+            "Args/patience_minutes":  20,
+            "Args/warm_start":        "last",
+            "Args/test_queue":        EXECUTION_QUEUE,
+        }
+    ),
+    # Step 5: Final Model Training
+    dict(
+        name="step5_final",
+        parents=["step4_hpo", "step2_unzip"],
+        base_task_name="Step 5: Final Model Training",
+        script="scripts/s5_final_training.py",
+        parameter_override={
+            "Args/dataset_task_id": "${step2_unzip.id}",
+            "Args/hpo_task_id":     "${step4_hpo.id}",
+            "Args/model_arch":      "yolo11n.pt",
+            "Args/imgsz":           640,
+            "Args/project":         "AlphaFirewatch",
+            "Args/name":            "yolov11_final",
+            "Args/conf_thres":      0.25,
+            # step 4 searched the batch size: train with its winner, not the tuner's pick
+            "Args/tune_batch":      0,
+        }
+    ),
+    # Step 6: Export ONNX / OpenVINO models and check them against the .pt model
+    dict(
+        name="step6_export",
+        parents=["step5_final", "step2_unzip"],
+        base_task_name="Step 6: Export Optimized Models",
+        script="scripts/s6_export.py",
+        parameter_override={
+            "Args/dataset_task_id": "${step2_unzip.id}",
+            "Args/final_task_id":   "${step5_final.id}",
+            "Args/formats":         "onnx,openvino",
+            "Args/imgsz":           640,
+            "Args/min_agreement":   0.95,
+        }
+    ),
+    # Step 7: INT8 post-training quantization (runs alongside step 6)
+    dict(
+        name="step7_quantize",
+        parents=["step5_final", "step2_unzip"],
+        base_task_name="Step 7: INT8 Quantization",
+        script="scripts/s7_quantize.py",
+        parameter_override={
+            "Args/dataset_task_id": "${step2_unzip.id}",
+            "Args/final_task_id":   "${step5_final.id}",
+            "Args/imgsz":           640,
+            "Args/calib_images":    300,
+            "Args/max_map_drop":    0.02,
+        }
+    ),
+]
+
+
+def launch_remote():
+    from clearml.automation import PipelineController
 
-# Step 1: Download compressed dataset
-pipe.add_step(
-    name="step1_download_zip",
-    base_task_project="AlphaFirewatch",
-    base_task_name="Step 1: Download Compressed Dataset",
-    execution_queue=EXECUTION_QUEUE,
-)
+    pipe = PipelineController(
+        project="AlphaFirewatch",
+        name="Firewatch End-to-End Pipeline",
+        version="0.0.5",
+        add_pipeline_tags=False,
+    )
+    pipe.set_default_execution_queue(EXECUTION_QUEUE)
 
-# Step 2: Unzip YOLO Dataset
-pipe.add_step(
-    name="step2_unzip",
-    parents=["step1_download_zip"],
-    base_task_project="AlphaFirewatch",
-    base_task_name="Step 2: Unzip YOLO Dataset",
-    execution_queue=EXECUTION_QUEUE,
-    parameter_override={
-        "Args/dataset_task_id": "${step1_download_zip.id}"
-    }
-)
+    for step in STEPS:
+        pipe.add_step(
+            name=step["name"],
+            parents=step.get("parents"),
+            base_task_project="AlphaFirewatch",
+            base_task_name=step["base_task_name"],
+            execution_queue=EXECUTION_QUEUE,
+            parameter_override=step.get("parameter_override"),
+        )
 
-# Step 3: Fire & Smoke Detection Training
-pipe.add_step(
-    name="step3_train",
-    parents=["step2_unzip"],
-    base_task_project="AlphaFirewatch",
-    base_task_name="Step 3: Fire and Smoke Detection Training",
-    execution_queue=EXECUTION_QUEUE,
-    parameter_override={
-        "Args/dataset_task_id": "${step2_unzip.id}",
-        "Args/model_arch":      "yolo11n.pt",
-        "Args/epochs":          50,
-        "Args/batch":           50,
-        "Args/imgsz":           640,
-    }
-)
+    pipe.start(queue=EXECUTION_QUEUE)
+    print("Pipeline launched, controller ID:", pipe.id)
 
-# Step 4: Hyper‐Parameter Optimization
-pipe.add_step(
-    name="step4_hpo",
-    parents=["step3_train", "step2_unzip"],
-    base_task_project="AlphaFirewatch",
-    base_task_name="HPO: FireWatch YOLO Tuning",
-    execution_queue=EXECUTION_QUEUE,
-    parameter_override={
-        "Args/dataset_task_id":   "${step2_unzip.id}",
-        "Args/train_task_id":     "${step3_train.id}",
-        "Args/num_trials":        4,
-        "Args/epochs":            100,
-        "Args/time_limit_minutes": 60,
-        "Args/test_queue":        EXECUTION_QUEUE,
-    }
-)
 
-# Step 5: Final Model Training
-pipe.add_step(
-    name="step5_final",
-    parents=["step4_hpo", "step2_unzip"],
-    base_task_project="AlphaFirewatch",
-    base_task_name="Step 5: Final Model Training",
-    execution_queue=EXECUTION_QUEUE,
-    parameter_override={
-        "Args/dataset_task_id": "${step2_unzip.id}",
-        "Args/hpo_task_id":     "${step4_hpo.id}",
-        "Args/model_arch":      "yolo11n.pt",
-        "Args/imgsz":           640,
-        "Args/project":         "AlphaFirewatch",
-        "Args/name":            "yolov11_final",
-        "Args/conf_thres":      0.25,
-    }
-)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the Firewatch pipeline")
+    parser.add_argument("--local", action="store_true",
+                        help="Run the steps on this machine instead of the ClearML queue")
+    parser.add_argument("--jobs", type=int, default=2, help="Steps run at the same time (local)")
+    parser.add_argument("--cache-dir", default=".pipeline_cache", help="Step output cache (local)")
+    parser.add_argument("--force", nargs="*", default=[], metavar="STEP",
+                        help="Re-run these steps and their descendants even if cached (local)")
+    args = parser.parse_args()
 
-pipe.start(queue=EXECUTION_QUEUE)
-print("Pipeline launched, controller ID:", pipe.id)
+    if args.local:
+        from local_pipeline import run_local
 
+        raise SystemExit(run_local(STEPS, cache_dir=args.cache_dir, jobs=args.jobs, force=args.force))
+    launch_remote()
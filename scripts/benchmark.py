@@ -0,0 +1,182 @@
+# benchmark.py
+#
+# CPU-only per-stage latency benchmark over the bundled test images and videos:
+#   python scripts/benchmark.py --output bench.json
+#   python scripts/benchmark.py --baseline bench.json   # fail on regressions
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from dataset_utils import list_images
+from frame_renderer import FrameRenderer
+from inference_backend import BACKENDS, resolve_weights
+
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_IMAGES = [os.path.join(os.path.dirname(SCRIPTS), "data", "test")]
+DEFAULT_VIDEOS = [
+    os.path.join(SCRIPTS, "Upload", f"fire_video_1_{q}.mp4") for q in ("low", "mid", "hd")
+]
+STAGES = ("decode", "preprocess", "predict", "nms", "plot", "encode")
+PERCENTILES = (50, 95, 99)
+
+
+def image_frames(folder, limit):
+    # the bundled folders are small, so cycle them to fill the warmup plus timed frames
+    paths = list_images(folder)
+    for i in range(limit if paths else 0):
+        path = paths[i % len(paths)]
+        start = time.perf_counter()
+        frame = cv2.imread(path)
+        yield frame, time.perf_counter() - start
+
+
+def video_frames(path, limit):
+    cap = cv2.VideoCapture(path)
+    try:
+        for _ in range(limit):
+            start = time.perf_counter()
+            success, frame = cap.read()
+            if not success:
+                break
+            yield frame, time.perf_counter() - start
+    finally:
+        cap.release()
+
+
+def time_frame(model, frame, decode_s, imgsz, encoder):
+    result = model.predict(frame, imgsz=imgsz, device="cpu", verbose=False)[0]
+    start = time.perf_counter()
+    plotted = result.plot()
+    plot_s = time.perf_counter() - start
+    start = time.perf_counter()
+    encoder.encode(plotted)
+    encode_s = time.perf_counter() - start
+    # ultralytics reports its own stages in ms; NMS is its postprocess step
+    return {
+        "decode": 1000 * decode_s,
+        "preprocess": result.speed["preprocess"],
+        "predict": result.speed["inference"],
+        "nms": result.speed["postprocess"],
+        "plot": 1000 * plot_s,
+        "encode": 1000 * encode_s,
+    }
+
+
+def summarize(samples):
+    summary = {}
+    totals = np.array([sum(s.values()) for s in samples])
+    for stage in STAGES + ("total",):
+        values = totals if stage == "total" else np.array([s[stage] for s in samples])
+        summary[stage] = {f"p{p}": round(float(np.percentile(values, p)), 3) for p in PERCENTILES}
+        summary[stage]["mean"] = round(float(values.mean()), 3)
+    summary["fps"] = round(1000.0 / max(summary["total"]["mean"], 1e-9), 2)
+    summary["frames"] = len(samples)
+    return summary
+
+
+def run(args):
+    import ultralytics
+    from ultralytics import YOLO
+
+    model = YOLO(resolve_weights(args.weights, args.backend), task="detect")
+    encoder = FrameRenderer(slot=None, display_width=args.display_width)
+
+    sources = [(f"images:{os.path.basename(os.path.normpath(d))}", d) for d in args.images]
+    sources += [(f"video:{os.path.basename(v)}", v) for v in args.videos]
+
+    report = {
+        "meta": {
+            "weights": str(args.weights),
+            "backend": args.backend,
+            "ultralytics": ultralytics.__version__,
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        },
+        "results": {},
+    }
+    for label, source in sources:
+        if not os.path.exists(source):
+            print(f"⚠️  Skipping missing source {source}")
+            continue
+        for imgsz in args.imgsz:
+            frames = image_frames(source, args.frames) if label.startswith("images:") else video_frames(source, args.frames)
+            samples, resolution = [], None
+            for i, (frame, decode_s) in enumerate(frames):
+                if frame is None:
+                    continue
+                resolution = f"{frame.shape[1]}x{frame.shape[0]}"
+                timings = time_frame(model, frame, decode_s, imgsz, encoder)
+                if i >= args.warmup:
+                    samples.append(timings)
+            if not samples:
+                print(f"⚠️  No timed frames for {label} at imgsz={imgsz}")
+                continue
+            key = f"{label}|{resolution}|imgsz={imgsz}"
+            report["results"][key] = summarize(samples)
+            total = report["results"][key]["total"]
+            print(f"{key}: p50 {total['p50']:.1f} ms  p95 {total['p95']:.1f} ms  "
+                  f"p99 {total['p99']:.1f} ms  {report['results'][key]['fps']:.1f} fps")
+    return report
+
+
+def compare(report, baseline, tolerance):
+    # A stage regresses when its p50 is more than `tolerance` slower than the baseline
+    regressions = []
+    for key, current in report["results"].items():
+        previous = baseline.get("results", {}).get(key)
+        if previous is None:
+            continue
+        for stage in STAGES + ("total",):
+            old, new = previous[stage]["p50"], current[stage]["p50"]
+            if old > 0 and new > old * (1 + tolerance):
+                regressions.append(f"{key} {stage}: p50 {old:.2f} → {new:.2f} ms (+{(new / old - 1):.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage CPU inference benchmark")
+    parser.add_argument("--weights", default=os.path.join(SCRIPTS, "weights", "best.pt"), help="Model weights")
+    parser.add_argument("--backend", default="pytorch", choices=sorted(BACKENDS), help="Inference runtime")
+    parser.add_argument("--images", nargs="*", default=DEFAULT_IMAGES, help="Image folders to benchmark")
+    parser.add_argument("--videos", nargs="*", default=DEFAULT_VIDEOS, help="Video files to benchmark")
+    parser.add_argument("--frames", type=int, default=120, help="Frames read per source, warmup included")
+    parser.add_argument("--imgsz", type=int, nargs="+", default=[320, 640], help="Inference sizes to sweep")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed frames per source and size")
+    parser.add_argument("--display-width", type=int, default=960, help="Width frames are encoded at")
+    parser.add_argument("--output", default="benchmark.json", help="Where to write the JSON report")
+    parser.add_argument("--baseline", default=None, help="Earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed p50 slow-down vs. baseline")
+    args = parser.parse_args()
+
+    # read first: --output may point at the baseline file
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    # CPU only, even on a machine with a GPU
+    os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    report = run(args)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Wrote {args.output}")
+
+    if baseline is not None:
+        regressions = compare(report, baseline, args.tolerance)
+        for line in regressions:
+            print(f"❌ {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ No stage slower than baseline by more than {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
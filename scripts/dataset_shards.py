@@ -0,0 +1,295 @@
+# dataset_shards.py
+#
+# Pack a YOLO dataset into memory-mapped shards of pre-resized images, e.g.
+#   python scripts/dataset_shards.py --data yolo_data/data.yaml --output shards --imgsz 640
+# and train from them with model.train(data=<output>/data.yaml, trainer=ShardTrainer).
+import argparse
+import hashlib
+import json
+import math
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+import yaml
+from ultralytics.data.dataset import YOLODataset
+from ultralytics.models.yolo.detect import DetectionTrainer
+from ultralytics.utils import colorstr
+from ultralytics.utils.torch_utils import de_parallel
+
+from dataset_utils import data_cache_dir, file_lock, label_path, list_images, read_yolo_boxes, split_dir
+
+SPLITS = ("train", "val", "test")
+SHARD_BYTES = 1 << 30
+INDEX_DTYPE = np.dtype([
+    ("shard", np.int32), ("offset", np.int64),
+    ("h", np.int32), ("w", np.int32), ("h0", np.int32), ("w0", np.int32),
+    ("label_start", np.int64), ("label_count", np.int32),
+])
+
+
+def resize_for_training(image, imgsz):
+    # Same rule as Ultralytics' load_image(rect_mode=True): longest side → imgsz
+    h0, w0 = image.shape[:2]
+    r = imgsz / max(h0, w0)
+    if r != 1:
+        size = (min(math.ceil(w0 * r), imgsz), min(math.ceil(h0 * r), imgsz))
+        image = cv2.resize(image, size, interpolation=cv2.INTER_LINEAR)
+    return image
+
+
+def load_sample(path, imgsz):
+    # Runs in a worker process: decoded, resized image + (N, 5) cls/xywh labels
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        return None, None, None
+    return resize_for_training(image, imgsz), image.shape[:2], read_yolo_boxes(label_path(path))
+
+
+def source_signature(images, imgsz):
+    digest = hashlib.sha1(str(imgsz).encode())
+    for path in images:
+        for f in (path, label_path(path)):
+            if os.path.exists(f):
+                st = os.stat(f)
+                digest.update(f"{f}:{st.st_size}:{st.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+
+# ─── Packing ───────────────────────────────────────────────────────────────────
+def pack_split(images, out_dir, imgsz=640, shard_bytes=SHARD_BYTES, workers=None):
+    """Write ``images`` (and their YOLO labels) as raw uint8 shards plus an index."""
+    os.makedirs(out_dir, exist_ok=True)
+    for name in os.listdir(out_dir):
+        if name.startswith("shard-"):
+            os.remove(os.path.join(out_dir, name))  # left over from an earlier, larger pack
+    index, labels, files = [], [], []
+    shard, offset, out = 0, 0, None
+    label_start = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        samples = pool.map(load_sample, images, [imgsz] * len(images), chunksize=16)
+        for path, (image, shape, boxes) in zip(images, samples):
+            if image is None:
+                print(f"⚠️  Could not decode {path}")
+                continue
+            h0, w0 = shape
+            data = np.ascontiguousarray(image).tobytes()
+            if out is None or (offset and offset + len(data) > shard_bytes):
+                if out is not None:
+                    out.close()
+                    shard += 1
+                out = open(os.path.join(out_dir, f"shard-{shard:05d}.bin"), "wb")
+                offset = 0
+            out.write(data)
+            h, w = image.shape[:2]
+            index.append((shard, offset, h, w, h0, w0, label_start, len(boxes)))
+            labels.append(boxes)
+            files.append(os.path.basename(path))
+            offset += len(data)
+            label_start += len(boxes)
+    if out is not None:
+        out.close()
+
+    np.save(os.path.join(out_dir, "index.npy"), np.array(index, dtype=INDEX_DTYPE))
+    np.save(os.path.join(out_dir, "labels.npy"),
+            np.concatenate(labels) if labels else np.zeros((0, 5), dtype=np.float32))
+    with open(os.path.join(out_dir, "files.json"), "w") as f:
+        json.dump(files, f)
+    return len(index)
+
+
+def pack_dataset(data_yaml, out_dir=None, imgsz=640, workers=None):
+    """Pack every split of ``data_yaml`` into ``out_dir``; returns a data.yaml for the shards.
+
+    Without ``out_dir`` the shards go to the data cache (``$FIREWATCH_DATA_CACHE``),
+    never into the dataset folder, which may be another step's finished output,
+    in a folder keyed by the dataset version (its files' signature) and ``imgsz``.
+    A pack is written to a temporary folder and renamed into place, so trials
+    that share the cache only ever see complete shards, and a changed dataset
+    gets a new folder instead of being repacked under a running trial.
+    """
+    with open(data_yaml) as f:
+        cfg = yaml.safe_load(f)
+    splits = {}
+    for split in SPLITS:
+        try:
+            splits[split] = list_images(split_dir(data_yaml, split))
+        except (KeyError, FileNotFoundError):
+            continue
+
+    signature = source_signature([p for images in splits.values() for p in images], imgsz)
+    if out_dir is None:
+        out_dir = os.path.join(data_cache_dir(), "shards", f"{signature[:16]}-{imgsz}")
+    out_dir = os.path.abspath(out_dir)
+    meta_path = os.path.join(out_dir, "meta.json")
+    shard_yaml = os.path.join(out_dir, "data.yaml")
+    # trials sharing a dataset cache wait for one pack instead of racing each other
+    with file_lock(out_dir + ".lock"):
+        if os.path.isfile(meta_path) and os.path.isfile(shard_yaml):
+            with open(meta_path) as f:
+                if json.load(f).get("signature") == signature:
+                    print(f"✅ Shards up to date in {out_dir}")
+                    return shard_yaml
+
+        tmp_dir = tempfile.mkdtemp(prefix=f".{os.path.basename(out_dir)}-", dir=os.path.dirname(out_dir))
+        try:
+            for split, images in splits.items():
+                count = pack_split(images, os.path.join(tmp_dir, split), imgsz=imgsz, workers=workers)
+                print(f"📦 Packed {count} {split} images → {os.path.join(out_dir, split)}")
+
+            with open(os.path.join(tmp_dir, "data.yaml"), "w") as f:
+                yaml.safe_dump({
+                    "path": out_dir,
+                    **{split: split for split in splits},
+                    "nc": cfg.get("nc", len(cfg["names"])),
+                    "names": cfg["names"],
+                }, f)
+            with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+                json.dump({"signature": signature, "imgsz": imgsz}, f)
+
+            # an explicit out_dir may hold an older pack: move it aside, don't write into it
+            stale = None
+            if os.path.exists(out_dir):
+                stale = tempfile.mkdtemp(prefix=f".{os.path.basename(out_dir)}-stale-", dir=os.path.dirname(out_dir))
+                os.rename(out_dir, os.path.join(stale, "shards"))
+            os.rename(tmp_dir, out_dir)
+            if stale:
+                shutil.rmtree(stale, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+    return shard_yaml
+
+
+# ─── Reading ───────────────────────────────────────────────────────────────────
+class ShardReader:
+    """Random access to one packed split; images are zero-copy views into the shards."""
+
+    def __init__(self, split_dir):
+        self.split_dir = split_dir
+        self.index = np.load(os.path.join(split_dir, "index.npy"))
+        self.labels = np.load(os.path.join(split_dir, "labels.npy"), mmap_mode="r")
+        with open(os.path.join(split_dir, "files.json")) as f:
+            self.files = json.load(f)
+        self._shards = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def _shard(self, n):
+        # opened lazily, so each dataloader worker maps the files itself
+        if n not in self._shards:
+            self._shards[n] = np.memmap(os.path.join(self.split_dir, f"shard-{n:05d}.bin"), np.uint8, "r")
+        return self._shards[n]
+
+    def image(self, i):
+        row = self.index[i]
+        size = int(row["h"]) * int(row["w"]) * 3
+        start = int(row["offset"])
+        return self._shard(int(row["shard"]))[start:start + size].reshape(int(row["h"]), int(row["w"]), 3)
+
+    def boxes(self, i):
+        row = self.index[i]
+        start = int(row["label_start"])
+        return np.array(self.labels[start:start + int(row["label_count"])])
+
+    def orig_shape(self, i):
+        return int(self.index[i]["h0"]), int(self.index[i]["w0"])
+
+    def __getstate__(self):
+        # memmaps don't pickle into dataloader workers; they reopen on first use
+        state = self.__dict__.copy()
+        state["_shards"] = {}
+        return state
+
+
+class ShardDataset(YOLODataset):
+    """A YOLODataset whose images and labels come from a packed split.
+
+    ``img_path`` is the split's shard folder. Augmentation, mosaic buffering
+    and rectangular batching are inherited unchanged; only file listing,
+    label loading and image decoding are replaced.
+    """
+
+    def get_img_files(self, img_path):
+        self.reader = ShardReader(img_path)
+        return [os.path.join(img_path, name) for name in self.reader.files]
+
+    def get_labels(self):
+        self.label_files = []
+        labels = []
+        for i, im_file in enumerate(self.im_files):
+            boxes = self.reader.boxes(i)
+            labels.append({
+                "im_file": im_file,
+                "shape": self.reader.orig_shape(i),
+                "cls": boxes[:, 0:1],
+                "bboxes": boxes[:, 1:5],
+                "segments": [],
+                "keypoints": None,
+                "normalized": True,
+                "bbox_format": "xywh",
+            })
+        return labels
+
+    def load_image(self, i, rect_mode=True):
+        if self.ims[i] is not None:
+            return self.ims[i], self.im_hw0[i], self.im_hw[i]
+        h0, w0 = self.reader.orig_shape(i)
+        im = self.reader.image(i)
+        if rect_mode:
+            if max(im.shape[:2]) != self.imgsz:  # packed at a different size
+                im = resize_for_training(im, self.imgsz)
+        elif im.shape[:2] != (self.imgsz, self.imgsz):
+            im = cv2.resize(im, (self.imgsz, self.imgsz), interpolation=cv2.INTER_LINEAR)
+        im = np.array(im)  # own the pixels; augmentations may write in place
+
+        # keep the base class's mosaic buffer behaviour
+        if self.augment:
+            self.ims[i], self.im_hw0[i], self.im_hw[i] = im, (h0, w0), im.shape[:2]
+            self.buffer.append(i)
+            if len(self.buffer) >= self.max_buffer_length:
+                j = self.buffer.pop(0)
+                self.ims[j], self.im_hw0[j], self.im_hw[j] = None, None, None
+        return im, (h0, w0), im.shape[:2]
+
+
+class ShardTrainer(DetectionTrainer):
+    """DetectionTrainer that reads train/val batches from packed shards."""
+
+    def build_dataset(self, img_path, mode="train", batch=None):
+        gs = max(int(de_parallel(self.model).stride.max() if self.model else 0), 32)
+        return ShardDataset(
+            img_path=img_path,
+            imgsz=self.args.imgsz,
+            batch_size=batch,
+            augment=mode == "train",
+            hyp=self.args,
+            rect=self.args.rect or mode == "val",
+            cache=None,  # the shards already are the cache
+            single_cls=self.args.single_cls or False,
+            stride=gs,
+            pad=0.0 if mode == "train" else 0.5,
+            prefix=colorstr(f"{mode}: "),
+            classes=self.args.classes,
+            data=self.data,
+            fraction=self.args.fraction if mode == "train" else 1.0,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack a YOLO dataset into memory-mapped shards")
+    parser.add_argument("--data", required=True, help="Source data.yaml")
+    parser.add_argument("--output", default=None, help="Output folder (default: in the data cache)")
+    parser.add_argument("--imgsz", type=int, default=640, help="Longest side images are stored at")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Decode processes")
+    args = parser.parse_args()
+    shard_yaml = pack_dataset(args.data, args.output, imgsz=args.imgsz, workers=args.workers)
+    print(f"✅ Train with data={shard_yaml}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# dataset_utils.py
+import os
+import random
+from contextlib import contextmanager
+
+import yaml
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+DATA_CACHE_ENV = "FIREWATCH_DATA_CACHE"
+COMPLETE = ".complete"
+
+
+def split_dir(data_yaml, split):
+    """Resolve the image folder of ``split`` ("train", "val", "test") in a data.yaml.
+
+    Roboflow exports write paths like ``../valid/images`` relative to a layout
+    that rarely survives unzipping, so a few candidate bases are tried.
+    """
+    with open(data_yaml) as f:
+        cfg = yaml.safe_load(f)
+    entry = cfg.get(split) or cfg.get({"val": "valid"}.get(split, split))
+    if not entry:
+        raise KeyError(f"No '{split}' split in {data_yaml}")
+    yaml_dir = os.path.dirname(os.path.abspath(data_yaml))
+    base = os.path.join(yaml_dir, cfg.get("path", ""))
+    candidates = [
+        os.path.join(base, entry),
+        os.path.join(yaml_dir, entry),
+        os.path.join(yaml_dir, entry.lstrip("./")),
+    ]
+    for candidate in candidates:
+        if os.path.isdir(candidate):
+            return os.path.normpath(candidate)
+    raise FileNotFoundError(f"'{split}' images not found; tried {candidates}")
+
+
+def list_images(folder):
+    found = []
+    for root, _, files in os.walk(folder):
+        found.extend(
+            os.path.join(root, name) for name in files
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTS
+        )
+    return sorted(found)
+
+
+def label_path(image_path):
+    # YOLO layout: .../images/x.jpg → .../labels/x.txt, or a .txt next to the image
+    stem = os.path.splitext(image_path)[0]
+    parts = stem.split(os.sep)
+    if "images" in parts:
+        idx = len(parts) - 1 - parts[::-1].index("images")
+        parts[idx] = "labels"
+        candidate = os.sep.join(parts) + ".txt"
+        if os.path.exists(candidate):
+            return candidate
+    return stem + ".txt"
+
+
+def read_yolo_boxes(label_file):
+    """(N, 5) float32 cls/x/y/w/h rows of a YOLO label file; polygons become their bounding box."""
+    import numpy as np
+
+    rows = []
+    if os.path.isfile(label_file):
+        with open(label_file) as f:
+            for line in f:
+                values = [float(v) for v in line.split()]
+                if len(values) > 5:  # polygon → its bounding box
+                    xy = np.array(values[1:]).reshape(-1, 2)
+                    (x1, y1), (x2, y2) = xy.min(axis=0), xy.max(axis=0)
+                    values = [values[0], (x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1]
+                if len(values) == 5:
+                    rows.append(values)
+    return np.array(rows, dtype=np.float32).reshape(-1, 5)
+
+
+def sample_images(data_yaml, split, n=None, seed=0):
+    images = list_images(split_dir(data_yaml, split))
+    if n is not None and n < len(images):
+        images = random.Random(seed).sample(images, n)
+    return images
+
+
+def _check_image(path):
+    # Runs in a worker thread: "corrupt" if the file can't be fully decoded
+    from PIL import Image
+
+    try:
+        with Image.open(path) as im:
+            im.verify()
+        if path.lower().endswith((".jpg", ".jpeg")):
+            with open(path, "rb") as f:
+                f.seek(-2, os.SEEK_END)
+                if f.read() != b"\xff\xd9":
+                    return "truncated"  # missing JPEG end-of-image marker
+    except Exception:
+        return "corrupt"
+    return None
+
+
+def _check_label(path):
+    with open(path) as f:
+        rows = [line.split() for line in f if line.strip()]
+    if not rows:
+        return "empty"
+    for row in rows:
+        try:
+            values = [float(v) for v in row[1:]]
+        except ValueError:
+            return "malformed"
+        if len(values) < 4 or len(values) % 2 or any(v < 0 or v > 1 for v in values):
+            return "malformed"
+    return None
+
+
+def check_dataset(root, workers=8):
+    """Pair every image under ``root`` with its YOLO label and report problems.
+
+    Returns a dict of problem → sorted paths: ``missing_label`` (images with no
+    label file), ``orphan_label`` (labels with no image), ``empty_label``,
+    ``malformed_label`` (bad numbers or coordinates outside 0..1) and
+    ``corrupt_image`` (undecodable or truncated files).
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    images = list_images(root)
+    labels = {
+        os.path.join(dirpath, name)
+        for dirpath, _, files in os.walk(root)
+        for name in files
+        if name.endswith(".txt") and not name.startswith(".")
+    }
+    report = {key: [] for key in ("missing_label", "orphan_label", "empty_label", "malformed_label", "corrupt_image")}
+    paired = set()
+    for image in images:
+        label = label_path(image)
+        if label in labels:
+            paired.add(label)
+        else:
+            report["missing_label"].append(image)
+    # anything next to a data split that isn't an image's label (README etc. at the root is fine)
+    report["orphan_label"] = sorted(
+        label for label in labels - paired if os.path.dirname(label) != os.path.normpath(root)
+    )
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for image, problem in zip(images, pool.map(_check_image, images)):
+            if problem:
+                report["corrupt_image"].append(image)
+        for label, problem in zip(sorted(paired), pool.map(_check_label, sorted(paired))):
+            if problem:
+                report[f"{problem}_label"].append(label)
+    return report
+
+
+def data_cache_dir():
+    return os.environ.get(DATA_CACHE_ENV) or os.path.join(os.path.expanduser("~"), ".firewatch", "datasets")
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive lock on ``path`` across processes (e.g. HPO trials on one worker)."""
+    import fcntl
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def fetch_yolo_dataset(dataset_task_id):
+    """Local copy of the dataset Step 2 published.
+
+    Versions are downloaded once per worker into a writable cache folder
+    (``$FIREWATCH_DATA_CACHE``, default ``~/.firewatch/datasets``) that every
+    step and HPO trial on that worker shares, together with anything derived
+    from it, such as the training shards.
+    """
+    from pipeline_utils import get_artifact, get_parameter, is_local_ref
+
+    dataset_id = None if is_local_ref(dataset_task_id) else get_parameter(dataset_task_id, "Dataset/yolo_dataset_id")
+    if dataset_id:
+        from clearml import Dataset
+
+        target = os.path.join(data_cache_dir(), dataset_id)
+        with file_lock(target + ".lock"):
+            if not os.path.isfile(os.path.join(target, COMPLETE)):
+                Dataset.get(dataset_id=dataset_id).get_mutable_local_copy(target, overwrite=True)
+                open(os.path.join(target, COMPLETE), "w").close()
+            else:
+                print(f"✅ Dataset {dataset_id} already cached in {target}")
+        return target
+    # local executor runs, and Step 2 runs from before datasets were versioned,
+    # hand over a folder artifact instead
+    return get_artifact(dataset_task_id, "yolo_dataset")
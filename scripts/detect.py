@@ -1,11 +1,282 @@
-from ultralytics import YOLO
-import sys
+# detect.py
+#
+# Headless batch detection over image directories, e.g.
+#   python scripts/detect.py --source data --output detections.jsonl
+#   python scripts/detect.py --source /archive --output scores.parquet --save-plots plots/
+# Re-running the same command after an interruption resumes from the checkpoint;
+# images already in the output are skipped, even if files were added since.
+import argparse
+import collections
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
 
-# Load the trained model
-model = YOLO('runs/detect/train5/weights/best.pt')
+import cv2
 
-# Run inference on an image (you can change the path below)
-results = model('data/sample.jpg')
+from inference_backend import BACKENDS, resolve_weights
 
-# Save the detection result (with bounding boxes)
-results.save()  # Output will be saved to runs/detect/predict/
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+
+def iter_images(root):
+    # Deterministic depth-first walk
+    with os.scandir(root) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from iter_images(entry.path)
+        elif os.path.splitext(entry.name)[1].lower() in IMAGE_EXTS:
+            yield entry.path
+
+
+def decode(path, imgsz):
+    # Runs in a worker process: decode and shrink to the inference size so only
+    # a small array travels back to the parent
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        return path, None, None, 1.0
+    h, w = image.shape[:2]
+    scale = min(1.0, imgsz / max(h, w))
+    if scale < 1.0:
+        image = cv2.resize(image, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+    return path, image, (w, h), scale
+
+
+def bounded_map(pool, fn, jobs, window):
+    # Like pool.map, but keeps at most `window` decodes in flight instead of
+    # submitting the whole (possibly huge) directory listing up front
+    pending = collections.deque()
+    for job in jobs:
+        pending.append(pool.submit(fn, *job))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+# ─── Checkpoint ────────────────────────────────────────────────────────────────
+def load_checkpoint(path):
+    if not os.path.isfile(path):
+        return {"processed": 0, "offset": 0, "parts": 0}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, state):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+# ─── Writers ───────────────────────────────────────────────────────────────────
+class JsonlWriter:
+    def __init__(self, path, state):
+        self.path = path
+        self.f = open(path, "ab")
+        # drop anything written after the last checkpoint
+        self.f.truncate(state["offset"])
+        self.f.seek(state["offset"])
+
+    @staticmethod
+    def exists(path):
+        return os.path.isfile(path) and os.path.getsize(path) > 0
+
+    @staticmethod
+    def remove(path):
+        os.remove(path)
+
+    def done_paths(self):
+        # the checkpointed part of the output is the record of what was processed
+        with open(self.path, "rb") as f:
+            return {json.loads(line)["path"] for line in f if line.strip()}
+
+    def write(self, records, state):
+        for record in records:
+            self.f.write(json.dumps(record).encode() + b"\n")
+        self.f.flush()
+        state["offset"] = self.f.tell()
+        return True
+
+    def close(self, state):
+        self.f.close()
+
+
+class ParquetWriter:
+    # Parquet files can't be appended to, so the output is a directory of parts
+    def __init__(self, path, state, rows_per_part=10000):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise SystemExit("Parquet output needs pyarrow: pip install pyarrow") from e
+        self.pa, self.pq = pa, pq
+        # explicit, so parts starting with a decode-failure row keep every column
+        self.schema = pa.schema([
+            ("path", pa.string()),
+            ("width", pa.int64()),
+            ("height", pa.int64()),
+            ("detections", pa.list_(pa.struct([
+                ("cls", pa.int64()), ("name", pa.string()), ("conf", pa.float64()),
+                ("xyxy", pa.list_(pa.float64())),
+            ]))),
+            ("error", pa.string()),
+        ])
+        self.path = path
+        self.rows_per_part = rows_per_part
+        self.buffer = []
+        os.makedirs(path, exist_ok=True)
+        # drop parts written after the last checkpoint
+        for name in self._parts(path):
+            if int(name[len("part-"):-len(".parquet")]) >= state["parts"]:
+                os.remove(os.path.join(path, name))
+
+    @staticmethod
+    def _parts(path):
+        return sorted(n for n in os.listdir(path) if n.startswith("part-") and n.endswith(".parquet"))
+
+    @classmethod
+    def exists(cls, path):
+        return os.path.isdir(path) and bool(cls._parts(path))
+
+    @classmethod
+    def remove(cls, path):
+        for name in cls._parts(path):
+            os.remove(os.path.join(path, name))
+
+    def done_paths(self):
+        done = set()
+        for name in self._parts(self.path):
+            done.update(self.pq.read_table(os.path.join(self.path, name), columns=["path"]).column("path").to_pylist())
+        return done
+
+    def write(self, records, state):
+        self.buffer.extend(records)
+        if len(self.buffer) < self.rows_per_part:
+            return False
+        self._flush(state)
+        return True
+
+    def _flush(self, state):
+        if not self.buffer:
+            return
+        part = os.path.join(self.path, f"part-{state['parts']:05d}.parquet")
+        self.pq.write_table(self.pa.Table.from_pylist(self.buffer, schema=self.schema), part)
+        state["parts"] += 1
+        self.buffer = []
+
+    def close(self, state):
+        self._flush(state)
+
+
+def to_record(path, size, scale, result, names):
+    boxes = result.boxes
+    xyxy = (boxes.xyxy.cpu().numpy() / scale).round(1).tolist()
+    return {
+        "path": path,
+        "width": size[0],
+        "height": size[1],
+        "detections": [
+            {"cls": int(c), "name": names[int(c)], "conf": round(float(p), 4), "xyxy": box}
+            for c, p, box in zip(boxes.cls.tolist(), boxes.conf.tolist(), xyxy)
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch fire detection over image directories")
+    parser.add_argument("--weights", default="runs/detect/train5/weights/best.pt", help="Model weights")
+    parser.add_argument("--source", nargs="+", default=["data"], help="Image directories to scan recursively")
+    parser.add_argument("--output", default="detections.jsonl", help="Output .jsonl file or .parquet directory")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file (default: <output>.ckpt)")
+    parser.add_argument("--batch", type=int, default=16, help="Images per predict call")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Decode processes")
+    parser.add_argument("--imgsz", type=int, default=640, help="Inference image size")
+    parser.add_argument("--conf", type=float, default=0.25, help="Confidence threshold")
+    parser.add_argument("--device", default=None, help="Device, e.g. cpu or 0")
+    parser.add_argument("--backend", default="pytorch", choices=sorted(BACKENDS),
+                        help="Runtime; onnx/openvino load the export next to --weights")
+    parser.add_argument("--save-plots", default=None, metavar="DIR", help="Also save annotated images here")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="Replace an existing output that has no checkpoint to resume from")
+    args = parser.parse_args()
+
+    from ultralytics import YOLO
+
+    checkpoint = args.checkpoint or f"{args.output.rstrip(os.sep)}.ckpt"
+    writer_cls = ParquetWriter if args.output.endswith(".parquet") else JsonlWriter
+    if not os.path.isfile(checkpoint) and writer_cls.exists(args.output):
+        if not args.overwrite:
+            raise SystemExit(f"{args.output} exists but has no checkpoint ({checkpoint}); "
+                             "pass --overwrite to replace it")
+        writer_cls.remove(args.output)
+    state = load_checkpoint(checkpoint)
+    writer = writer_cls(args.output, state)
+    done = writer.done_paths()
+    if done:
+        print(f"→ Resuming, skipping {len(done)} images already in {args.output}")
+    if args.save_plots:
+        os.makedirs(args.save_plots, exist_ok=True)
+
+    model = YOLO(resolve_weights(args.weights, args.backend), task="detect")
+    # plots keep their path below the sources, so same-named images don't overwrite each other
+    plot_root = os.path.commonpath([os.path.abspath(root) for root in args.source])
+
+    def jobs():
+        for root in args.source:
+            for path in iter_images(root):
+                if path not in done:
+                    yield path, args.imgsz
+
+    # unflushed = images in the writer's buffer but not yet covered by the checkpoint
+    batch, records, unflushed, failed = [], [], 0, 0
+
+    def run_batch():
+        nonlocal records, unflushed
+        results = model.predict(
+            source=[image for _, image, _, _ in batch],
+            imgsz=args.imgsz,
+            conf=args.conf,
+            device=args.device,
+            verbose=False
+        )
+        for (path, _, size, scale), result in zip(batch, results):
+            records.append(to_record(path, size, scale, result, model.names))
+            if args.save_plots:
+                plot_path = os.path.join(args.save_plots, os.path.relpath(os.path.abspath(path), plot_root))
+                os.makedirs(os.path.dirname(plot_path), exist_ok=True)
+                cv2.imwrite(plot_path, result.plot())
+        unflushed += len(batch)
+        batch.clear()
+        if writer.write(records, state):
+            state["processed"] += unflushed
+            unflushed = 0
+            save_checkpoint(checkpoint, state)
+        records = []
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        window = 2 * args.batch * max(args.workers, 1)
+        for path, image, size, scale in bounded_map(pool, decode, jobs(), window):
+            if image is None:
+                failed += 1
+                print(f"⚠️  Could not decode {path}")
+                # still a row, so the image counts as processed and isn't retried on resume
+                records.append({"path": path, "error": "decode_failed"})
+                unflushed += 1
+                continue
+            batch.append((path, image, size, scale))
+            if len(batch) >= args.batch:
+                run_batch()
+        if batch:
+            run_batch()
+    if records:  # decode failures after the last batch
+        writer.write(records, state)
+
+    writer.close(state)
+    state["processed"] += unflushed
+    save_checkpoint(checkpoint, state)
+    print(f"✅ Processed {state['processed']} images ({failed} unreadable) → {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# event_store.py
+import argparse
+import csv
+import os
+import sqlite3
+import threading
+import time
+
+from perf_metrics import DETECTIONS_LOGGED
+
+COLUMNS = ("timestamp", "drone", "confidence", "lat", "lon", "status", "fire_id")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    id         INTEGER PRIMARY KEY,
+    timestamp  TEXT NOT NULL,   -- 'YYYY-MM-DD HH:MM:SS', sorts chronologically
+    drone      TEXT NOT NULL,
+    confidence REAL,
+    lat        REAL,
+    lon        REAL,
+    status     TEXT,
+    fire_id    TEXT             -- tracker uuid; all rows of one fire share it
+);
+CREATE INDEX IF NOT EXISTS idx_detections_time ON detections (timestamp);
+CREATE INDEX IF NOT EXISTS idx_detections_drone_time ON detections (drone, timestamp);
+CREATE TABLE IF NOT EXISTS imports (
+    source      TEXT PRIMARY KEY,
+    rows        INTEGER,
+    imported_at TEXT
+);
+"""
+
+
+class DetectionStore:
+    """SQLite (WAL mode) store for detection events.
+
+    ``add`` only appends to an in-memory buffer; rows are written in a single
+    transaction once ``flush_size`` rows are pending or the oldest pending row is
+    ``flush_interval`` seconds old. Queries flush first, so readers in the same
+    process always see every event.
+    """
+
+    def __init__(self, path, flush_size=50, flush_interval=2.0):
+        self.path = str(path)
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = []
+        self._oldest_pending = None
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(detections)")}
+        if "fire_id" not in columns:
+            with self._conn:
+                self._conn.execute("ALTER TABLE detections ADD COLUMN fire_id TEXT")
+
+    # ─── Writes ────────────────────────────────────────────────────────────────
+    def add(self, timestamp, drone, confidence, lat, lon, status, fire_id=None):
+        DETECTIONS_LOGGED.inc(status=status)
+        with self._lock:
+            if not self._pending:
+                self._oldest_pending = time.monotonic()
+            self._pending.append((timestamp, drone, confidence, lat, lon, status, fire_id))
+            due = (
+                len(self._pending) >= self.flush_size
+                or time.monotonic() - self._oldest_pending >= self.flush_interval
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            rows, self._pending = self._pending, []
+            if rows:
+                with self._conn:
+                    self._conn.executemany(
+                        f"INSERT INTO detections ({', '.join(COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        rows
+                    )
+            return len(rows)
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+    # ─── Queries ───────────────────────────────────────────────────────────────
+    def _query(self, sql, params=()):
+        self.flush()
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def recent(self, limit=20, drone=None, start=None, end=None):
+        # newest first; start/end are inclusive 'YYYY-MM-DD HH:MM:SS' bounds
+        clauses, params = [], []
+        if drone:
+            clauses.append("drone = ?")
+            params.append(drone)
+        if start:
+            clauses.append("timestamp >= ?")
+            params.append(start)
+        if end:
+            clauses.append("timestamp <= ?")
+            params.append(end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        params.append(limit)
+        return self._query(
+            f"SELECT {', '.join(COLUMNS)} FROM detections {where} "
+            "ORDER BY timestamp DESC LIMIT ?",
+            params
+        )
+
+    def drones(self):
+        return [row["drone"] for row in self._query("SELECT DISTINCT drone FROM detections ORDER BY drone")]
+
+    # ─── One-time CSV import ───────────────────────────────────────────────────
+    def import_csv(self, csv_path):
+        """Load a legacy ``detections.csv`` once; returns the number of rows added."""
+        source = os.path.abspath(csv_path)
+        if not os.path.isfile(source):
+            return 0
+        with self._lock:
+            done = self._conn.execute("SELECT 1 FROM imports WHERE source = ?", (source,)).fetchone()
+        if done:
+            return 0
+
+        rows = []
+        with open(source, newline="") as f:
+            for record in csv.DictReader(f):
+                # the old writer put a stray space before lon, so strip every field
+                record = {k.strip(): (v or "").strip() for k, v in record.items() if k}
+                if not record.get("timestamp"):
+                    continue
+                rows.append((
+                    record["timestamp"],
+                    record.get("drone", ""),
+                    _to_float(record.get("confidence")),
+                    _to_float(record.get("lat")),
+                    _to_float(record.get("lon")),
+                    record.get("status", ""),
+                    None,
+                ))
+
+        self.flush()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT INTO detections ({', '.join(COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.execute(
+                "INSERT INTO imports (source, rows, imported_at) VALUES (?, ?, datetime('now'))",
+                (source, len(rows))
+            )
+        return len(rows)
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+
+def open_store(path, **kwargs):
+    # One store per database file per process, shared by every Streamlit session
+    key = os.path.abspath(path)
+    with _STORES_LOCK:
+        if key not in _STORES:
+            _STORES[key] = DetectionStore(path, **kwargs)
+        return _STORES[key]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import a legacy detections.csv into the event store")
+    parser.add_argument("csv_path", help="detections.csv to import")
+    parser.add_argument("--db", default="detections.db", help="SQLite database to write")
+    args = parser.parse_args()
+
+    store = DetectionStore(args.db)
+    added = store.import_csv(args.csv_path)
+    store.close()
+    print(f"✅ Imported {added} rows from {args.csv_path} into {args.db}")
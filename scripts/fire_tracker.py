@@ -0,0 +1,143 @@
+# fire_tracker.py
+import collections
+import uuid
+
+import numpy as np
+
+START = "start"
+UPDATE = "update"
+END = "end"
+
+TrackEvent = collections.namedtuple("TrackEvent", "kind track")
+
+
+class Track:
+    def __init__(self, box, score, now):
+        # unique across runs and processes, since every run logs into the same store
+        self.id = str(uuid.uuid4())
+        self.box = box
+        self.confidence = score          # latest
+        self.peak_confidence = score
+        self.reported_confidence = None  # peak at the last START/UPDATE event
+        self.first_seen = now
+        self.last_seen = now
+        self.hits = 1
+        self.confirmed = False
+        self.meta = {}                   # caller-owned, e.g. the mocked location
+
+
+def iou_matrix(a, b):
+    # a: (N, 4), b: (M, 4) xyxy → (N, M)
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def _centers(boxes):
+    return (boxes[:, :2] + boxes[:, 2:]) / 2
+
+
+class FireTracker:
+    """Turns per-frame fire boxes into fire events with a start, updates and an end.
+
+    Boxes are matched to open tracks greedily by IoU; boxes that overlap nothing
+    fall back to the nearest track centre within ``max_center_shift`` of the frame
+    diagonal (smoke and flames change shape quickly). A track is announced with a
+    START event once it has been seen ``confirm_hits`` times, emits UPDATE only
+    when its peak confidence rises by ``update_delta``, and ENDs after
+    ``max_age`` seconds without a match.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_center_shift=0.1, confirm_hits=2,
+                 max_age=3.0, update_delta=0.1):
+        self.iou_threshold = iou_threshold
+        self.max_center_shift = max_center_shift
+        self.confirm_hits = confirm_hits
+        self.max_age = max_age
+        self.update_delta = update_delta
+        self.tracks = []
+
+    @property
+    def active(self):
+        return [t for t in self.tracks if t.confirmed]
+
+    def _match(self, boxes, frame_diag):
+        matches = []
+        if not self.tracks or not len(boxes):
+            return matches, set(range(len(boxes)))
+        track_boxes = np.array([t.box for t in self.tracks])
+        unmatched_tracks = set(range(len(self.tracks)))
+        unmatched_boxes = set(range(len(boxes)))
+
+        ious = iou_matrix(track_boxes, boxes)
+        for ti, bi in zip(*np.unravel_index(np.argsort(-ious, axis=None), ious.shape)):
+            if ious[ti, bi] < self.iou_threshold:
+                break
+            if ti in unmatched_tracks and bi in unmatched_boxes:
+                matches.append((ti, bi))
+                unmatched_tracks.discard(ti)
+                unmatched_boxes.discard(bi)
+
+        if unmatched_tracks and unmatched_boxes:
+            ts, bs = sorted(unmatched_tracks), sorted(unmatched_boxes)
+            dist = np.linalg.norm(
+                _centers(track_boxes[ts])[:, None] - _centers(boxes[bs])[None], axis=2
+            ) / frame_diag
+            for i, j in zip(*np.unravel_index(np.argsort(dist, axis=None), dist.shape)):
+                if dist[i, j] > self.max_center_shift:
+                    break
+                if ts[i] in unmatched_tracks and bs[j] in unmatched_boxes:
+                    matches.append((ts[i], bs[j]))
+                    unmatched_tracks.discard(ts[i])
+                    unmatched_boxes.discard(bs[j])
+        return matches, unmatched_boxes
+
+    def update(self, boxes, scores, now, frame_shape):
+        """Feed one frame's fire boxes (xyxy pixels); returns the resulting events."""
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+        frame_diag = float(np.hypot(*frame_shape[:2])) or 1.0
+        events = []
+
+        matches, new_boxes = self._match(boxes, frame_diag)
+        for ti, bi in matches:
+            track = self.tracks[ti]
+            track.box = boxes[bi]
+            track.confidence = float(scores[bi])
+            track.peak_confidence = max(track.peak_confidence, track.confidence)
+            track.last_seen = now
+            track.hits += 1
+        for bi in sorted(new_boxes):
+            self.tracks.append(Track(boxes[bi], float(scores[bi]), now))
+
+        for track in self.tracks:
+            if track.last_seen != now:
+                continue
+            if not track.confirmed and track.hits >= self.confirm_hits:
+                track.confirmed = True
+                track.reported_confidence = track.peak_confidence
+                events.append(TrackEvent(START, track))
+            elif track.confirmed and track.peak_confidence >= track.reported_confidence + self.update_delta:
+                track.reported_confidence = track.peak_confidence
+                events.append(TrackEvent(UPDATE, track))
+
+        events.extend(self._expire(now))
+        return events
+
+    def _expire(self, now, force=False):
+        events, alive = [], []
+        for track in self.tracks:
+            if force or now - track.last_seen > self.max_age:
+                if track.confirmed:
+                    events.append(TrackEvent(END, track))
+            else:
+                alive.append(track)
+        self.tracks = alive
+        return events
+
+    def close(self, now):
+        # End every open track, e.g. when the stream stops
+        return self._expire(now, force=True)
@@ -0,0 +1,81 @@
+# frame_renderer.py
+import io
+import time
+
+import cv2
+from PIL import Image
+
+from perf_metrics import RENDER_LATENCY
+
+
+class FrameRenderer:
+    """Draws inference results into a Streamlit placeholder at a capped rate.
+
+    Each displayed frame is plotted once, downscaled to ``display_width`` and
+    JPEG-encoded before it is sent to the browser, so a HD source costs no more
+    websocket bandwidth than the page can show. Frames arriving faster than
+    ``target_fps`` are not drawn at all unless ``force`` is set (e.g. for the
+    frame that raised an alert). The resize, colour-convert and JPEG buffers are
+    reused between frames.
+    """
+
+    def __init__(self, slot, target_fps=15.0, display_width=960, jpeg_quality=80, caption=None,
+                 name="main"):
+        self.slot = slot
+        self.name = name
+        self.min_interval = 1.0 / target_fps if target_fps else 0.0
+        self.display_width = display_width
+        self.jpeg_quality = jpeg_quality
+        self.caption = caption
+        self.displayed = 0
+        self.throttled = 0
+        self.render_time = 0.0
+        self._last_shown = 0.0
+        self._resized = None
+        self._rgb = None
+        self._jpeg = io.BytesIO()
+        self._started = time.monotonic()
+
+    def _downscale(self, image):
+        h, w = image.shape[:2]
+        if w <= self.display_width:
+            return image
+        size = (self.display_width, round(h * self.display_width / w))
+        if self._resized is None or self._resized.shape[1::-1] != size:
+            self._resized = None
+        self._resized = cv2.resize(image, size, dst=self._resized, interpolation=cv2.INTER_AREA)
+        return self._resized
+
+    def encode(self, image):
+        image = self._downscale(image)
+        if self._rgb is None or self._rgb.shape != image.shape:
+            self._rgb = None
+        self._rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=self._rgb)
+        self._jpeg.seek(0)
+        self._jpeg.truncate()
+        Image.fromarray(self._rgb).save(self._jpeg, format="JPEG", quality=self.jpeg_quality)
+        return self._jpeg.getvalue()
+
+    def render(self, result, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_shown < self.min_interval:
+            self.throttled += 1
+            return False
+        start = time.perf_counter()
+        jpeg = self.encode(result.plot())
+        self.slot.image(jpeg, caption=self.caption, use_container_width=True)
+        elapsed = time.perf_counter() - start
+        self.render_time += elapsed
+        RENDER_LATENCY.observe(elapsed, stream=self.name)
+        self._last_shown = now
+        self.displayed += 1
+        return True
+
+    def stats(self):
+        elapsed = max(time.monotonic() - self._started, 1e-6)
+        return {
+            "displayed": self.displayed,
+            "displayed_fps": self.displayed / elapsed,
+            "throttled": self.throttled,
+            "render_ms": 1000.0 * self.render_time / max(self.displayed, 1),
+        }
@@ -0,0 +1,32 @@
+# inference_backend.py
+from pathlib import Path
+
+# Ultralytics runs all of these through the same YOLO(...).predict() API; the
+# backend only decides which exported weights file gets loaded.
+BACKENDS = {
+    "pytorch": "PyTorch",
+    "onnx": "ONNX Runtime",
+    "openvino": "OpenVINO",
+}
+
+
+def exported_path(weights, backend):
+    # Where `s6_export.py` / `YOLO.export()` put each format next to the .pt file
+    weights = Path(weights)
+    if backend == "pytorch":
+        return weights
+    if backend == "onnx":
+        return weights.with_suffix(".onnx")
+    if backend == "openvino":
+        return weights.parent / f"{weights.stem}_openvino_model"
+    raise ValueError(f"Unknown inference backend {backend!r}; choose from {', '.join(BACKENDS)}")
+
+
+def resolve_weights(weights, backend="pytorch"):
+    path = exported_path(weights, backend)
+    if not path.exists():
+        raise FileNotFoundError(
+            f"No {BACKENDS[backend]} model at {path}; export it first, e.g. "
+            f"YOLO('{weights}').export(format='{backend}', dynamic=True)"
+        )
+    return path
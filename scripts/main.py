@@ -4,7 +4,6 @@ import torch
 import cv2
 from pathlib import Path
 import sys
-from ultralytics import YOLO
 from PIL import Image
 import pydeck as pdk
 import pandas as pd
@@ -14,6 +13,20 @@ import datetime
 import streamlit as st
 import random
 
+from event_store import open_store
+from fire_tracker import END, START, UPDATE, FireTracker
+from frame_renderer import FrameRenderer
+from inference_backend import BACKENDS, exported_path, resolve_weights
+from model_cascade import CROPS, FRAME, ModelCascade
+from model_registry import get_model
+from motion_gate import MotionGate
+from perf_metrics import REGISTRY as METRICS, start_http_server
+from resolution_controller import LADDER, ResolutionController
+from stream_manager import StreamManager
+from stream_pipeline import StreamPipeline
+from tiled_inference import FULL, ROI, TiledPredictor
+from video_source import VideoReader
+
 # 1️⃣ PAGE CONFIG & GLOBAL STYLES
 st.set_page_config(
     page_title="Alpha Firewatch",
@@ -131,18 +144,23 @@ UPLOAD_DICT = {
     'Video 3': UPLOAD_DIR/'fire_video_1_hd.mp4'
 }
 
-LOG_CSV = ROOT / "detections.csv"
-if not LOG_CSV.exists():
-    pd.DataFrame(columns=["timestamp","drone","confidence","lat","lon","status"]).to_csv(LOG_CSV, index=False)
+LOG_CSV = ROOT / "detections.csv"  # legacy log, imported into LOG_DB once
+LOG_DB = ROOT / "detections.db"
+event_store = open_store(LOG_DB)
+event_store.import_csv(LOG_CSV)
 
 #Model Config
 MODEL_DIR = ROOT/'weights'
 # DETECTION_MODEL = MODEL_DIR/'yolo11l.pt'
 DETECTION_MODEL = MODEL_DIR/'best.pt'
+# fire-trained large model, only run on frames the cascade escalates
+CONFIRM_MODEL = MODEL_DIR/'yolo11l.pt'
 
-LOG_INTERVAL = datetime.timedelta(seconds=30)
-LAST_LOG = datetime.datetime.min
 TARGET_CLASS = "fire"
+# what each fire-track transition is logged as
+EVENT_STATUS = {START: "ACTIVE", UPDATE: "UPDATED", END: "ENDED"}
+
+METRICS_PORT = 9108
 
 # base lat/lon for mocking
 BASE_LAT, BASE_LON = -33.5, 151.2
@@ -169,16 +187,6 @@ def open_first_working_camera(indices):
     return None
 
 
-try:
-    model = YOLO(DETECTION_MODEL)
-except Exception as e:
-    st.error(f"Unable to load model. Check the specified path:\n`{DETECTION_MODEL}`")
-    st.error(str(e))
-    st.stop()  # stop execution if the model can't be loaded
-
-
-
-
 # Custom CSS
 
 
@@ -201,6 +209,206 @@ with st.sidebar:
     )
     confidence = confidence_pct / 100.0
 
+    st.markdown("### 🧠 Inference Backend")
+    backend = st.selectbox(
+        "Runtime",
+        list(BACKENDS),
+        format_func=BACKENDS.get,
+        help="ONNX Runtime / OpenVINO need the exported model from the export pipeline step"
+    )
+
+    st.markdown("### 🔬 Small-Fire Detection")
+    tiling_mode = st.radio(
+        "Sliced inference",
+        (None, FULL, ROI),
+        format_func={None: "Off", FULL: "Tile every frame", ROI: "Tile around candidates"}.get,
+        help="Runs the model on full-resolution tiles so distant fires in HD footage aren't downsampled away"
+    )
+    tile_size = st.select_slider("Tile size (px)", options=[320, 416, 512, 640], value=640)
+    tile_overlap = st.slider("Tile overlap (%)", 0, 50, 20, 5)
+
+    st.markdown("### 🪜 Model Cascade")
+    use_cascade = st.checkbox(
+        "Confirm detections with the large model", value=False,
+        help=f"{DETECTION_MODEL.name} screens every frame; {CONFIRM_MODEL.name} must agree before "
+             "an alert is logged. Not used with sliced inference."
+    )
+    cascade_mode = st.radio(
+        "Confirm on", (CROPS, FRAME),
+        format_func={CROPS: "Crops around candidates", FRAME: "Whole frame"}.get
+    )
+    screen_pct = st.slider("Screening threshold (%)", 5, 50, 10, 1)
+
+    st.markdown("### ⚖️ Adaptive Resolution")
+    adaptive_resolution = st.checkbox(
+        "Lower input size to keep up", value=False,
+        help=f"Steps through {'/'.join(map(str, LADDER))} px by measured inference time; "
+             "goes back up while a fire is tracked. Not used with sliced inference."
+    )
+    target_fps = st.slider("Target inference rate (fps)", 1, 30, 10, 1)
+
+    st.markdown("### 🎯 Motion Gating")
+    motion_gating = st.checkbox("Skip inference on static frames", value=True)
+    gate_sensitivity = st.slider("Changed pixels to re-run model (%)", 0.1, 10.0, 1.0, 0.1)
+    gate_max_interval = st.slider("Force a refresh every (s)", 0.5, 10.0, 2.0, 0.5)
+
+    st.markdown("### 🖥️ Display")
+    display_fps = st.slider("Display frame rate (fps)", 1, 30, 12, 1)
+    display_width = st.select_slider("Display width (px)", options=[480, 640, 800, 960, 1280], value=960)
+
+try:
+    # loaded and warmed up once per process, shared by every session and
+    # hot-swapped when weights/best.pt (or its export) is replaced
+    model_path = resolve_weights(DETECTION_MODEL, backend)
+    model = get_model(model_path, device=device)
+except Exception as e:
+    st.error(f"Unable to load model. Check the specified path:\n`{exported_path(DETECTION_MODEL, backend)}`")
+    st.error(str(e))
+    st.stop()  # stop execution if the model can't be loaded
+
+tiler = None
+if tiling_mode:
+    tiler = TiledPredictor(
+        model, mode=tiling_mode, tile_size=tile_size, overlap=tile_overlap / 100.0,
+        conf=confidence, device=device
+    )
+
+cascade = None
+if use_cascade and tiler is None:
+    try:
+        cascade = ModelCascade(
+            model, get_model(resolve_weights(CONFIRM_MODEL, backend), device=device),
+            target=TARGET_CLASS, conf=confidence, screen_conf=screen_pct / 100.0,
+            mode=cascade_mode, device=device
+        )
+    except Exception as e:
+        st.sidebar.error(f"Cascade disabled, cannot use `{exported_path(CONFIRM_MODEL, backend)}`: {e}")
+
+# Hot-path metrics: sidebar panel + local Prometheus scrape endpoint
+st.sidebar.markdown("### 📈 Performance")
+perf_slot = st.sidebar.empty()
+try:
+    metrics_host, metrics_port = start_http_server(METRICS_PORT)
+    st.sidebar.caption(f"Scrape: http://{metrics_host}:{metrics_port}/metrics")
+except OSError as e:
+    st.sidebar.caption(f"Metrics endpoint unavailable: {e}")
+
+
+# Runs on the pipeline's inference thread; one result per frame, in order
+def predict_frames(frames, imgsz=640):
+    if tiler is not None:
+        return tiler(frames)
+    if cascade is not None:
+        return cascade(frames, imgsz=imgsz)
+    return model.predict(
+        source=frames,
+        conf=confidence,
+        imgsz=imgsz,
+        device=device
+    )
+
+
+def make_motion_gate():
+    if not motion_gating:
+        return None
+    return MotionGate(min_changed=gate_sensitivity / 100.0, max_interval=gate_max_interval)
+
+
+def make_resolution_controller(name, fps=None):
+    if not adaptive_resolution or tiler is not None:
+        return None
+    return ResolutionController(target_fps=fps or target_fps, name=name)
+
+
+def controlled(predict_fn, controller):
+    # a predict_fn that always runs at the controller's current size
+    if controller is None:
+        return predict_fn
+    return lambda frames: predict_fn(frames, imgsz=controller.imgsz)
+
+
+def make_renderer(slot, caption=None, name="main"):
+    return FrameRenderer(
+        slot, target_fps=display_fps, display_width=display_width, caption=caption, name=name
+    )
+
+
+def show_performance():
+    rows = METRICS.summary_rows()
+    if rows:
+        perf_slot.dataframe(pd.DataFrame(rows).set_index("metric"), use_container_width=True)
+    else:
+        perf_slot.caption("No frames processed yet")
+
+
+def format_pipeline_stats(snap, render=None, resolution=None):
+    text = (
+        f"read {snap['read_fps']:.1f} fps · inferred {snap['inferred_fps']:.1f} fps · "
+        f"rendered {snap['rendered_fps']:.1f} fps · batch {snap['avg_batch']:.1f} · "
+        f"dropped {snap['dropped_capture']} (capture) / {snap['dropped_render']} (render)"
+    )
+    if "gate_skip_rate" in snap:
+        text += f" · model skipped on {snap['gate_skip_rate']:.0%} of frames ({snap['gate_refreshed']} forced refreshes)"
+    if resolution is not None:
+        res = resolution.stats()
+        text += f" · imgsz {res['imgsz']} ({res['latency_ms']:.0f} / {res['budget_ms']:.0f} ms budget)"
+    if tiler is not None:
+        text += f" · {tiler.stats()['tiles_per_frame']:.1f} tiles/frame"
+    if cascade is not None:
+        tiers = cascade.stats()
+        text += (f" · cascade escalated {tiers['escalation_rate']:.0%}, confirmed {tiers['hit_rate']:.0%} "
+                 f"({tiers['screen_ms']:.0f} ms screen / {tiers['confirm_ms']:.0f} ms confirm)")
+    if render is not None:
+        text += f" · displayed {render['displayed_fps']:.1f} fps ({render['render_ms']:.0f} ms/frame)"
+    return text
+
+
+def format_fleet_stats(snapshots):
+    return pd.DataFrame([
+        {
+            "Drone": drone_id,
+            "Read FPS": round(snap["read_fps"], 1),
+            "Inferred FPS": round(snap["inferred_fps"], 1),
+            "Inference (ms)": round(snap["inference_ms"], 1),
+            "Latency (ms)": round(snap["latency_ms"], 1),
+            "Dropped": snap["dropped"],
+            "Input size": snap.get("imgsz", 640),
+        }
+        for drone_id, snap in snapshots.items()
+    ]).set_index("Drone")
+
+
+def fire_boxes(result):
+    boxes = result.boxes
+    target_ids = [i for i, name in model.names.items() if name.lower() == TARGET_CLASS]
+    keep = np.isin(boxes.cls.cpu().numpy(), target_ids)
+    return boxes.xyxy.cpu().numpy()[keep], boxes.conf.cpu().numpy()[keep]
+
+
+def log_fire_events(events, drone, notice_slot):
+    # Only track state changes reach the event store; returns True when a fire
+    # started or got more confident, i.e. the current frame is worth showing
+    alerted = False
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for kind, track in events:
+        if kind == START:
+            # mock location, fixed for the lifetime of the fire
+            track.meta["lat"] = BASE_LAT + random.uniform(-MAX_JITTER, MAX_JITTER)
+            track.meta["lon"] = BASE_LON + random.uniform(-MAX_JITTER, MAX_JITTER)
+            notice_slot.success(
+                f"🚨 Detected **{TARGET_CLASS}** #{track.id[:8]} by Drone {drone} at {timestamp} "
+                f"(conf={track.peak_confidence:.2f})")
+        # buffered; written to the event store in batches
+        event_store.add(
+            timestamp, drone, round(track.peak_confidence, 2),
+            round(track.meta["lat"], 5), round(track.meta["lon"], 5),
+            EVENT_STATUS[kind], fire_id=track.id
+        )
+        alerted = alerted or kind != END
+    return alerted
+
+show_performance()
+
 # 3️⃣ HEADER
 st.markdown('<div class="title">Alpha Firewatch</div>', unsafe_allow_html=True)
 st.markdown('<div class="subtitle">Real-time fire detection & drone monitoring</div>', unsafe_allow_html=True)
@@ -222,7 +430,7 @@ elif page == "Surveillance":
     st.subheader("📡 Surveillance")
     input_type = st.radio(
         "Input source:",
-        ("Live Camera Feed", "Upload Video File")
+        ("Live Camera Feed", "Upload Video File", "Multiple Drone Feeds")
     )
     video_path = None
     if input_type == "Live Camera Feed":
@@ -244,54 +452,36 @@ elif page == "Surveillance":
 
         st_frame = st.empty()
         notice_slot = st.empty()
-        last_log = datetime.datetime.now() - LOG_INTERVAL
+        stats_slot = st.empty()
+        tracker = FireTracker()
+        drone = "D-1"
 
         # 4️⃣ Main streaming & logging loop
+        resolution = make_resolution_controller("camera")
+        pipeline = StreamPipeline(
+            video_cap, controlled(predict_frames, resolution), live=True,
+            gate=make_motion_gate(), name="camera"
+        )
+        renderer = make_renderer(st_frame, name="camera")
         try:
-            while video_cap.isOpened():
-                success, frame = video_cap.read()
-                if not success:
-                    break
-
-                results = model.predict(
-                    source=frame,
-                    conf=confidence,
-                    imgsz=640,
-                    device=device
-                )
-                targets = results[0].boxes
-                now = datetime.datetime.now()
-
-                if len(targets) and (now - last_log) >= LOG_INTERVAL:
-                    for conf, cls in zip(targets.conf, targets.cls):
-                        cls_name = model.names[int(cls.cpu().numpy())].lower()
-                        if cls_name == TARGET_CLASS:
-                            score = float(conf.cpu().numpy())
-
-                            # render annotated frame once
-                            out = results[0].plot()
-                            st_frame.image(out, channels="BGR", use_container_width=True)
-
-                            # mock location string
-                            lat = BASE_LAT + random.uniform(-MAX_JITTER, MAX_JITTER)
-                            lon = BASE_LON + random.uniform(-MAX_JITTER, MAX_JITTER)
-
-                            timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
-                            notice_slot.success(
-                                f"🚨 Detected **{TARGET_CLASS}** by Drone D1 at {timestamp} (conf={score:.2f})")
-                            drone = "D-1"
-                            status = "ACTIVE"
-                            # append only timestamp, class, confidence, location, status
-                            with open(LOG_CSV, "a") as f:
-                                f.write(f"{timestamp},{drone},{score:.2f},{lat:.5f}, {lon:.5f},{status}\n")
-
-                            last_log = now
-                            break
-                annotated = results[0].plot()
-                st_frame.image(annotated, channels="BGR", use_container_width=True)
+            for packet in pipeline.start():
+                result = packet.result
+                boxes, scores = fire_boxes(result)
+                events = tracker.update(boxes, scores, packet.frame.captured_at, result.orig_shape)
+                logged = log_fire_events(events, drone, notice_slot)
+                if resolution is not None:
+                    resolution.observe(packet.latency, detecting=bool(tracker.active))
+
+                # always show the frame that raised an alert
+                if renderer.render(result, force=logged):
+                    stats_slot.caption(format_pipeline_stats(pipeline.snapshot(), renderer.stats(), resolution))
+                    show_performance()
 
         finally:
+            pipeline.stop()
             video_cap.release()
+            log_fire_events(tracker.close(time.time()), drone, notice_slot)
+            event_store.flush()
             st.info("🔴 Streaming stopped.")
 
     elif input_type == "Upload Video File":
@@ -305,98 +495,155 @@ elif page == "Surveillance":
 
         st.video(str(video_path))
 
+        st.sidebar.markdown("### ⏩ Playback Range")
+        start_seconds = st.sidebar.number_input("Start at (s)", min_value=0, value=(5 * 60) + 5, step=5)
+        end_seconds = st.sidebar.number_input("Stop at (s, 0 = end of video)", min_value=0, value=0, step=5)
+        frame_stride = st.sidebar.slider("Analyse every Nth frame", 1, 60, 1, 1)
+
+        st.sidebar.markdown("### 📦 Batched Inference")
+        batch_size = st.sidebar.slider("Frames per batch", 1, 32, 8, 1)
+        batch_wait_ms = st.sidebar.slider("Max batch wait (ms)", 0, 500, 50, 10)
+
         if st.sidebar.button("Detect Video Objects"):
 
-            video_cap = cv2.VideoCapture(str(video_path))
+            video_cap = VideoReader(
+                video_path,
+                start_s=start_seconds,
+                end_s=end_seconds or None,
+                stride=frame_stride
+            )
             st_frame = st.empty()
 
-            fps = video_cap.get(cv2.CAP_PROP_FPS) or 30  # fallback to 30 if unavailable
-            skip_seconds = (5 * 60) + 5
-            skip_frames = int(fps * skip_seconds)
-
-            frame_idx = 0
             notice_slot = st.empty()
+            stats_slot = st.empty()
+
+            resolution = make_resolution_controller("upload")
+            pipeline = StreamPipeline(
+                video_cap, controlled(predict_frames, resolution), live=False, queue_size=4,
+                batch_size=batch_size, max_wait=batch_wait_ms / 1000.0,
+                gate=make_motion_gate(), name="upload"
+            )
+            renderer = make_renderer(st_frame, caption="Detected Video", name="upload")
+            tracker = FireTracker()
+            drone = "D-1"
+            video_time = 0.0
             try:
-                while video_cap.isOpened():
-                    success, frame = video_cap.read()
-
-                    frame_idx += 1
-                    if frame_idx <= skip_frames:
-                        continue
-
-                    if not success:
-                        break
-
-                    # YOLO inference
-                    results = model.predict(
-                        source=frame,
-                        conf=confidence,
-                        imgsz=640,  # or whatever image size your model expects
-                        device=device  # if you need to specify GPU/CPU
-                    )
-                    targets = results[0].boxes
-                    now = datetime.datetime.now()
-
-                    if len(targets) and (now - LAST_LOG) >= LOG_INTERVAL:
-                        logged = False
-                        for conf, cls in zip(targets.conf, targets.cls):
-                            cls_name = model.names[int(cls.cpu().numpy())].lower()
-                            if cls_name == TARGET_CLASS:
-                                score = float(conf.cpu().numpy())
-
-                                # render annotated frame once
-                                out = results[0].plot()
-                                st_frame.image(out, channels="BGR", use_container_width=True)
-
-                                # mock location string
-                                lat = BASE_LAT + random.uniform(-MAX_JITTER, MAX_JITTER)
-                                lon = BASE_LON + random.uniform(-MAX_JITTER, MAX_JITTER)
-
-                                timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
-                                notice_slot.success(f"🚨 Detected **{TARGET_CLASS}** by Drone D1 at {timestamp} (conf={score:.2f})")
-                                drone = "D-1"
-                                status = "ACTIVE"
-                                # append only timestamp, class, confidence, location, status
-                                with open(LOG_CSV, "a") as f:
-                                    f.write(f"{timestamp},{drone},{score:.2f},{lat:.5f}, {lon:.5f},{status}\n")
-
-                                LAST_LOG = now
-                                break
-
-                    else:
-                        notice_slot.info("No detection on this frame")
-
-                    result_plotted = results[0].plot()  # BGR image with boxes drawn
-
-                    # Display at full column width; Streamlit will scale it
-                    st_frame.image(
-                        result_plotted,
-                        caption="Detected Video",
-                        channels="BGR",
-                        use_container_width=True
-                    )
+                for packet in pipeline.start():
+                    result = packet.result
+                    # age tracks on video time, which runs faster than the wall clock here
+                    video_time = packet.frame.position_ms / 1000.0
+                    boxes, scores = fire_boxes(result)
+                    had_fire = bool(tracker.active)
+                    events = tracker.update(boxes, scores, video_time, result.orig_shape)
+                    logged = log_fire_events(events, drone, notice_slot)
+                    if had_fire and not tracker.active:
+                        notice_slot.info("No active fire")
+                    if resolution is not None:
+                        resolution.observe(packet.latency, detecting=bool(tracker.active))
+
+                    # always show the frame that raised an alert
+                    if renderer.render(result, force=logged):
+                        reader = video_cap.stats()
+                        stats_slot.caption(
+                            format_pipeline_stats(pipeline.snapshot(), renderer.stats(), resolution)
+                            + f" · decode {reader['decode_fps']:.1f} fps ({reader['speed']:.1f}× real time)"
+                        )
+                        show_performance()
             except Exception as e:
                 st.sidebar.error("Error running detection on video:")
                 st.sidebar.error(str(e))
             finally:
+                pipeline.stop()
                 video_cap.release()
+                log_fire_events(tracker.close(video_time), drone, notice_slot)
+                event_store.flush()
+
+    elif input_type == "Multiple Drone Feeds":
+        st.sidebar.markdown("### 🚁 Drone Feeds")
+        feed_spec = st.sidebar.text_area(
+            "One feed per line: drone ID, camera index / video file / stream URL[, target fps]",
+            value="\n".join(f"D-{i}, {path}" for i, path in enumerate(UPLOAD_DICT.values(), start=1))
+        )
+        fleet_batch = st.sidebar.slider("Max frames per batch", 1, 32, 8, 1)
+
+        if st.sidebar.button("Start Drone Feeds"):
+            manager = StreamManager(predict_frames, batch_size=fleet_batch)
+            panels = {}
+            try:
+                for line in feed_spec.splitlines():
+                    if "," not in line:
+                        continue
+                    drone_id, source = (part.strip() for part in line.split(",", 1))
+                    # optional per-drone target rate for adaptive resolution
+                    fps = None
+                    head, _, tail = source.rpartition(",")
+                    if head and tail.strip().replace(".", "", 1).isdigit():
+                        source, fps = head.strip(), float(tail)
+                    manager.add(
+                        drone_id, source, gate=make_motion_gate(),
+                        controller=make_resolution_controller(drone_id, fps)
+                    )
+            except IOError as e:
+                manager.stop()
+                st.error(str(e))
+                st.stop()
+
+            cols = st.columns(2)
+            for i, stream in enumerate(manager.streams):
+                with cols[i % 2]:
+                    panels[stream.drone_id] = (
+                        make_renderer(st.empty(), caption=stream.drone_id, name=stream.drone_id),
+                        st.empty(),
+                        FireTracker()
+                    )
+            stats_slot = st.empty()
+            stats_shown = 0.0
+            try:
+                manager.start()
+                while manager.running:
+                    for stream, packet in manager.poll():
+                        renderer, notice_slot, tracker = panels[stream.drone_id]
+                        result = packet.result
+                        boxes, scores = fire_boxes(result)
+                        events = tracker.update(boxes, scores, packet.frame.captured_at, result.orig_shape)
+                        logged = log_fire_events(events, stream.drone_id, notice_slot)
+                        if stream.controller is not None:
+                            stream.controller.observe(packet.latency, detecting=bool(tracker.active))
+                        renderer.render(result, force=logged)
+                    if time.monotonic() - stats_shown >= 1.0:
+                        stats_slot.dataframe(format_fleet_stats(manager.snapshot()))
+                        show_performance()
+                        stats_shown = time.monotonic()
+            finally:
+                manager.stop()
+                for drone_id, (_, notice_slot, tracker) in panels.items():
+                    log_fire_events(tracker.close(time.time()), drone_id, notice_slot)
+                event_store.flush()
 
     st.markdown(f"**Confidence threshold:** {confidence:.2f}")
 
 elif page == "Alerts":
     st.subheader("🚨 My Alerts")
     st.write("**Past fire detections & locations**")
-    df_log = pd.read_csv(LOG_CSV)
-    # We log a single “location” column
-    if "location" in df_log.columns:
-        df_log["Location"] = df_log["location"]
-    else:
-        df_log["Location"] = "Unknown"
 
-    recent = df_log.sort_values("timestamp", ascending=False).head(20)
+    filter_cols = st.columns(3)
+    drone_filter = filter_cols[0].selectbox("Drone", ["All"] + event_store.drones())
+    since = filter_cols[1].date_input("From", value=None)
+    until = filter_cols[2].date_input("To", value=None)
+
+    # served from the (timestamp) / (drone, timestamp) indexes
+    recent = pd.DataFrame(
+        event_store.recent(
+            limit=20,
+            drone=None if drone_filter == "All" else drone_filter,
+            start=f"{since} 00:00:00" if since else None,
+            end=f"{until} 23:59:59" if until else None,
+        ),
+        columns=["timestamp", "drone", "confidence", "lat", "lon", "status"]
+    )
 
     st.table(
-        recent[["timestamp", "drone", "confidence", "lat", "lon", "status"]]
+        recent
         .rename(columns={
             "timestamp": "Time",
             "drone": "Drone",
@@ -0,0 +1,141 @@
+# model_cascade.py
+import threading
+import time
+
+import numpy as np
+
+from perf_metrics import CASCADE_FRAMES, CASCADE_LATENCY
+from tiled_inference import boxes_array, make_result, nms
+
+CROPS = "crops"  # confirm on a window around each candidate
+FRAME = "frame"  # confirm on the whole candidate frame
+
+
+def class_ids(names, target):
+    return [i for i, name in names.items() if name.lower() == target]
+
+
+def candidate_window(box, height, width, margin=0.5, min_size=160):
+    # The candidate box grown by `margin` on each side, at least min_size square
+    x1, y1, x2, y2 = box
+    half_w = max((x2 - x1) * (1 + 2 * margin), min_size) / 2
+    half_h = max((y2 - y1) * (1 + 2 * margin), min_size) / 2
+    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+    return (
+        int(max(cx - half_w, 0)), int(max(cy - half_h, 0)),
+        int(min(cx + half_w, width)), int(min(cy + half_h, height)),
+    )
+
+
+class ModelCascade:
+    """Two-tier detection: a small model screens, a large one confirms.
+
+    Every frame goes through ``screen_model`` at the low ``screen_conf``. Only
+    frames with a ``target`` candidate are passed to ``confirm_model`` — either
+    one crop per candidate (``crops``, up to ``max_crops``; beyond that the
+    whole frame) or the whole frame (``frame``) — and only its detections at
+    ``conf`` are returned, so nothing reaches the tracker or the event store
+    without the large model agreeing. Frames without candidates come back
+    empty at screening cost.
+
+    Returned results carry the screening model's class names, so callers can
+    keep resolving the target class through ``screen_model.names``.
+    """
+
+    def __init__(self, screen_model, confirm_model, target="fire", conf=0.4, screen_conf=0.1,
+                 mode=CROPS, max_crops=4, crop_margin=0.5, confirm_imgsz=640, device=None):
+        self.screen_model = screen_model
+        self.confirm_model = confirm_model
+        self.target = target
+        self.conf = conf
+        self.screen_conf = min(screen_conf, conf)
+        self.mode = mode
+        self.max_crops = max_crops
+        self.crop_margin = crop_margin
+        self.confirm_imgsz = confirm_imgsz
+        self.device = device
+        for model in (screen_model, confirm_model):
+            if not class_ids(model.names, target):
+                raise ValueError(f"{getattr(model, 'weights', model)} has no {target!r} class")
+        self._counts = {"screened": 0, "escalated": 0, "confirmed": 0}
+        self._time = {"screen": 0.0, "confirm": 0.0}
+        self._confirm_calls = 0
+        self._lock = threading.Lock()
+
+    def _timed(self, tier, model, images, **kwargs):
+        start = time.perf_counter()
+        results = model.predict(source=images, device=self.device, verbose=False, **kwargs)
+        elapsed = time.perf_counter() - start
+        CASCADE_LATENCY.observe(elapsed / len(images), tier=tier)
+        with self._lock:
+            self._time[tier] += elapsed
+        return results
+
+    def _candidates(self, result):
+        data = boxes_array(result)
+        keep = np.isin(data[:, 5], class_ids(self.screen_model.names, self.target))
+        return data[keep]
+
+    def _crops(self, frame, candidates):
+        height, width = frame.shape[:2]
+        if self.mode == FRAME or len(candidates) > self.max_crops:
+            return [(0, 0, width, height)]
+        return [candidate_window(box, height, width, self.crop_margin) for box in candidates[:, :4]]
+
+    def __call__(self, frames, imgsz=640):
+        frames = list(frames)
+        screened = self._timed("screen", self.screen_model, frames, conf=self.screen_conf, imgsz=imgsz)
+
+        crops, owners = [], []
+        for i, (frame, result) in enumerate(zip(frames, screened)):
+            candidates = self._candidates(result)
+            if not len(candidates):
+                continue
+            for x1, y1, x2, y2 in self._crops(frame, candidates):
+                crops.append(frame[y1:y2, x1:x2])
+                owners.append((i, (x1, y1)))
+        confirmed = self._timed(
+            "confirm", self.confirm_model, crops, conf=self.conf, imgsz=self.confirm_imgsz
+        ) if crops else []
+
+        # confirmed target boxes, relabelled with the screening model's target class id
+        screen_id = class_ids(self.screen_model.names, self.target)[0]
+        confirm_ids = class_ids(self.confirm_model.names, self.target)
+        per_frame = [[] for _ in frames]
+        for (i, offset), result in zip(owners, confirmed):
+            data = boxes_array(result, offset)
+            data = data[np.isin(data[:, 5], confirm_ids)]
+            data[:, 5] = screen_id
+            per_frame[i].append(data)
+
+        results = []
+        for frame, parts in zip(frames, per_frame):
+            data = np.concatenate(parts) if parts else np.zeros((0, 6), dtype=np.float32)
+            if len(data):
+                data = data[nms(data[:, :4], data[:, 4], data[:, 5])]
+            results.append(make_result(frame, data, self.screen_model.names))
+
+        escalated = len({i for i, _ in owners})
+        hits = sum(1 for r in results if len(r.boxes))
+        CASCADE_FRAMES.inc(len(frames), outcome="screened")
+        CASCADE_FRAMES.inc(escalated, outcome="escalated")
+        CASCADE_FRAMES.inc(hits, outcome="confirmed")
+        with self._lock:
+            self._counts["screened"] += len(frames)
+            self._counts["escalated"] += escalated
+            self._counts["confirmed"] += hits
+            self._confirm_calls += len(crops)
+        return results
+
+    def stats(self):
+        with self._lock:
+            screened, escalated, confirmed = (self._counts[k] for k in ("screened", "escalated", "confirmed"))
+            return {
+                **self._counts,
+                # share of frames the large model had to look at
+                "escalation_rate": escalated / max(screened, 1),
+                # share of escalated frames the large model agreed with
+                "hit_rate": confirmed / max(escalated, 1),
+                "screen_ms": 1000.0 * self._time["screen"] / max(screened, 1),
+                "confirm_ms": 1000.0 * self._time["confirm"] / max(self._confirm_calls, 1),
+            }
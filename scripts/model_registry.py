@@ -0,0 +1,124 @@
+# model_registry.py
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+from ultralytics import YOLO
+
+logger = logging.getLogger(__name__)
+
+WARMUP_SHAPE = (640, 640, 3)
+
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+# ─── One loaded weights file ────────────────────────────────────────────────────
+class ModelHandle:
+    """A loaded, warmed-up model that can be swapped for a newer one in place.
+
+    Callers keep the handle and go through ``predict``; a hot-swap replaces the
+    model between two predict calls, so running streams never see a half-loaded
+    model and never have to reconnect.
+    """
+
+    def __init__(self, weights, device=None, imgsz=640):
+        self.weights = str(weights)
+        self.device = device
+        self.imgsz = imgsz
+        self.version = 0
+        self._lock = threading.Lock()
+        self._model = self._load()
+        self._signature = _file_signature(self.weights)
+
+    def _load(self):
+        # task is explicit because exported (.onnx / OpenVINO) models don't carry it
+        model = YOLO(self.weights, task="detect")
+        # the first predict call builds the predictor and fuses layers; pay it here
+        model.predict(
+            source=np.zeros(WARMUP_SHAPE, dtype=np.uint8),
+            imgsz=self.imgsz,
+            device=self.device,
+            verbose=False
+        )
+        return model
+
+    @property
+    def names(self):
+        return self._model.names
+
+    def predict(self, **kwargs):
+        # Ultralytics predictors are not safe to share between threads
+        with self._lock:
+            return self._model.predict(**kwargs)
+
+    def reload_if_changed(self):
+        signature = _file_signature(self.weights)
+        if signature is None or signature == self._signature:
+            return False
+        try:
+            model = self._load()
+        except Exception:
+            # most likely a weights file that is still being written; retry next poll
+            logger.exception("Failed to load updated weights %s", self.weights)
+            return False
+        with self._lock:
+            self._model = model
+            self._signature = signature
+            self.version += 1
+        logger.info("Hot-swapped %s (version %d)", self.weights, self.version)
+        return True
+
+
+# ─── Process-wide registry ──────────────────────────────────────────────────────
+class ModelRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._handles = {}
+        self._watcher = None
+
+    def get(self, weights, device=None, imgsz=640):
+        key = (os.path.abspath(weights), str(device), imgsz)
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is None:
+                handle = ModelHandle(weights, device=device, imgsz=imgsz)
+                self._handles[key] = handle
+            return handle
+
+    def watch(self, interval=5.0):
+        # Poll every loaded weights file and hot-swap it when it changes on disk
+        with self._lock:
+            if self._watcher is not None and self._watcher.is_alive():
+                return
+            self._watcher = threading.Thread(
+                target=self._watch_loop, args=(interval,), name="weights-watcher", daemon=True
+            )
+            self._watcher.start()
+
+    def _watch_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                handles = list(self._handles.values())
+            for handle in handles:
+                handle.reload_if_changed()
+
+
+# Streamlit re-executes main.py on every rerun and session, but imported modules
+# are cached, so this instance lives for the whole server process.
+REGISTRY = ModelRegistry()
+
+
+def get_model(weights, device=None, imgsz=640, watch=True):
+    handle = REGISTRY.get(weights, device=device, imgsz=imgsz)
+    if watch:
+        REGISTRY.watch()
+    return handle
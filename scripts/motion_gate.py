@@ -0,0 +1,75 @@
+# motion_gate.py
+import collections
+import threading
+import time
+
+import cv2
+import numpy as np
+
+INFER = "infer"        # scene changed (or nothing to compare against): run the model
+REUSE = "reuse"        # near-identical to the last inferred frame: reuse its result
+REFRESH = "refresh"    # unchanged, but the last result is too old: run the model anyway
+
+
+class MotionGate:
+    """Cheap per-frame decision on whether a frame needs a full inference.
+
+    Each frame is reduced to a small grayscale thumbnail and compared with the
+    thumbnail of the last frame that was sent to the model. If fewer than
+    ``min_changed`` of its pixels moved by more than ``pixel_delta`` grey levels,
+    the previous result is reused — but never for longer than ``max_interval``
+    seconds, so a slowly developing fire is still picked up.
+    """
+
+    def __init__(self, min_changed=0.01, pixel_delta=12, max_interval=2.0, thumb_size=(64, 36)):
+        self.min_changed = min_changed
+        self.pixel_delta = pixel_delta
+        self.max_interval = max_interval
+        self.thumb_size = thumb_size
+        self._reference = None
+        self._reference_at = 0.0
+        self._counts = collections.Counter()
+        self._lock = threading.Lock()
+
+    def _thumbnail(self, image):
+        small = cv2.resize(image, self.thumb_size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        # light blur so sensor noise doesn't count as motion
+        return cv2.GaussianBlur(small, (3, 3), 0)
+
+    def decide(self, image):
+        thumb = self._thumbnail(image)
+        now = time.monotonic()
+        if self._reference is None:
+            decision = INFER
+        else:
+            diff = cv2.absdiff(thumb, self._reference)
+            changed = np.count_nonzero(diff > self.pixel_delta) / diff.size
+            if changed >= self.min_changed:
+                decision = INFER
+            elif now - self._reference_at >= self.max_interval:
+                decision = REFRESH
+            else:
+                decision = REUSE
+        if decision != REUSE:
+            self._reference = thumb
+            self._reference_at = now
+        with self._lock:
+            self._counts[decision] += 1
+        return decision
+
+    def reset(self):
+        self._reference = None
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        total = sum(counts.values()) or 1
+        return {
+            "gate_inferred": counts.get(INFER, 0),
+            "gate_refreshed": counts.get(REFRESH, 0),
+            "gate_reused": counts.get(REUSE, 0),
+            # share of frames answered without running the model
+            "gate_skip_rate": counts.get(REUSE, 0) / total,
+        }
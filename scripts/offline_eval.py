@@ -0,0 +1,270 @@
+# offline_eval.py
+#
+# Detection metrics from cached predictions. A checkpoint runs over a split
+# once (at a low confidence floor) and the raw boxes are stored as .npz, keyed
+# by the checkpoint's bytes, the split's files and the prediction settings;
+# mAP, PR curves, size-bucket recall and confidence sweeps are then NumPy only:
+#   python scripts/offline_eval.py --weights best.pt other.pt --data data.yaml --conf 0.1 0.25 0.4
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from dataset_utils import label_path, list_images, read_yolo_boxes, split_dir
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".firewatch", "predictions")
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+SIZE_BUCKETS = {"small": (0, 32 ** 2), "medium": (32 ** 2, 96 ** 2), "large": (96 ** 2, np.inf)}  # COCO, px²
+
+
+# ─── Cached predictions ────────────────────────────────────────────────────────
+def _cache_key(weights, images, **settings):
+    digest = hashlib.sha1(json.dumps(settings, sort_keys=True).encode())
+    with open(weights, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    for path in images:
+        for f in (path, label_path(path)):
+            if os.path.exists(f):
+                st = os.stat(f)
+                digest.update(f"{f}:{st.st_size}:{st.st_mtime_ns}".encode())
+    return digest.hexdigest()[:16]
+
+
+def load_predictions(path):
+    with np.load(path) as f:
+        return {name: f[name] for name in f.files}
+
+
+def predict_split(weights, data_yaml, split="val", imgsz=640, conf=0.001, iou=0.7, batch=16,
+                  device=None, cache_dir=CACHE_DIR):
+    """Raw predictions and ground truth of ``split`` for ``weights``; returns ``(preds, npz_path)``.
+
+    Boxes are pixel xyxy in the original images; ``pred_image`` / ``gt_image``
+    index into ``files``. Inference only runs when no cached file matches.
+    """
+    images = list_images(split_dir(data_yaml, split))
+    key = _cache_key(weights, images, split=split, imgsz=imgsz, conf=conf, iou=iou)
+    path = os.path.join(cache_dir, f"{os.path.splitext(os.path.basename(weights))[0]}-{split}-{key}.npz")
+    if os.path.isfile(path):
+        print(f"✅ Cached predictions: {path}")
+        return load_predictions(path), path
+
+    from ultralytics import YOLO
+
+    model = YOLO(weights)
+    shapes, pred, gt = [], [], []
+    for start in range(0, len(images), batch):
+        chunk = images[start:start + batch]
+        results = model.predict(chunk, imgsz=imgsz, conf=conf, iou=iou, max_det=300, device=device, verbose=False)
+        for i, (image, result) in enumerate(zip(chunk, results), start):
+            h, w = result.orig_shape
+            shapes.append((h, w))
+            data = result.boxes.data.cpu().numpy().astype(np.float32).reshape(-1, 6)
+            pred.append(np.column_stack([np.full(len(data), i), data]))
+            labels = read_yolo_boxes(label_path(image))
+            xy, wh = labels[:, 1:3] * (w, h), labels[:, 3:5] * (w, h)
+            gt.append(np.column_stack([np.full(len(labels), i), labels[:, 0], xy - wh / 2, xy + wh / 2]))
+        print(f"🔍 {min(start + batch, len(images))}/{len(images)} images")
+    pred = np.concatenate(pred) if pred else np.zeros((0, 7))
+    gt = np.concatenate(gt) if gt else np.zeros((0, 6))
+    preds = {
+        "files": np.array([os.path.relpath(p, os.path.dirname(data_yaml)) for p in images]),
+        "shapes": np.array(shapes, dtype=np.int32).reshape(-1, 2),
+        "names": np.array(json.dumps({int(k): v for k, v in model.names.items()})),
+        "pred_image": pred[:, 0].astype(np.int32),
+        "pred_boxes": pred[:, 1:5].astype(np.float32),
+        "pred_scores": pred[:, 5].astype(np.float32),
+        "pred_classes": pred[:, 6].astype(np.int32),
+        "gt_image": gt[:, 0].astype(np.int32),
+        "gt_classes": gt[:, 1].astype(np.int32),
+        "gt_boxes": gt[:, 2:6].astype(np.float32),
+    }
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez_compressed(f, **preds)
+    os.replace(tmp, path)
+    print(f"💾 Predictions cached: {path}")
+    return preds, path
+
+
+# ─── Matching & metrics ────────────────────────────────────────────────────────
+def _pairs(pred_image, gt_image, n_images):
+    # every (prediction, ground truth) pair from the same image, without a per-image loop
+    by_image = np.argsort(gt_image, kind="stable")
+    gt_count = np.bincount(gt_image, minlength=n_images)
+    gt_start = np.cumsum(gt_count) - gt_count
+    per_pred = gt_count[pred_image]
+    p = np.repeat(np.arange(len(pred_image)), per_pred)
+    offset = np.arange(per_pred.sum()) - np.repeat(np.cumsum(per_pred) - per_pred, per_pred)
+    g = by_image[np.repeat(gt_start[pred_image], per_pred) + offset]
+    return p, g
+
+
+def _paired_iou(a, b):
+    tl = np.maximum(a[:, :2], b[:, :2])
+    br = np.minimum(a[:, 2:], b[:, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=1)
+    union = np.prod(a[:, 2:] - a[:, :2], axis=1) + np.prod(b[:, 2:] - b[:, :2], axis=1) - inter
+    return inter / np.maximum(union, 1e-9)
+
+
+def match(preds, iou_thresholds=IOU_THRESHOLDS):
+    """True positives per prediction and IoU threshold, plus the score each ground truth was found at.
+
+    COCO-style greedy matching: within an image, predictions are taken in
+    score order and each one takes the best-IoU ground truth of its class that
+    is still unmatched. The k-th most confident predictions of all images are
+    matched together, one vectorized round per rank. A prediction only depends
+    on more confident ones, so the result holds for any confidence threshold
+    applied afterwards.
+    """
+    scores, image = preds["pred_scores"], preds["pred_image"]
+    tp = np.zeros((len(scores), len(iou_thresholds)), dtype=bool)
+    gt_score = np.full((len(preds["gt_classes"]), len(iou_thresholds)), -np.inf, dtype=np.float32)
+    if not len(scores) or not len(gt_score):
+        return tp, gt_score
+
+    # rank of each prediction within its image, most confident first
+    order = np.lexsort((-scores, image))
+    first = np.searchsorted(image[order], image[order])
+    rank = np.empty(len(scores), dtype=np.int64)
+    rank[order] = np.arange(len(scores)) - first
+
+    p, g = _pairs(image, preds["gt_image"], len(preds["shapes"]))
+    iou = _paired_iou(preds["pred_boxes"][p], preds["gt_boxes"][g])
+    keep = (preds["pred_classes"][p] == preds["gt_classes"][g]) & (iou >= iou_thresholds[0])
+    p, g, iou = p[keep], g[keep], iou[keep]
+    by_rank = np.lexsort((-iou, p, rank[p]))  # per round: each prediction's candidates, best overlap first
+    p, g, iou = p[by_rank], g[by_rank], iou[by_rank]
+    bounds = np.searchsorted(rank[p], np.arange(rank.max() + 2))
+
+    matched = np.zeros(gt_score.shape, dtype=bool)
+    for r in range(rank.max() + 1):
+        pr, gr, ir = p[bounds[r]:bounds[r + 1]], g[bounds[r]:bounds[r + 1]], iou[bounds[r]:bounds[r + 1]]
+        for t, threshold in enumerate(iou_thresholds):
+            free = (ir >= threshold) & ~matched[gr, t]
+            pt, gt = pr[free], gr[free]
+            take = np.unique(pt, return_index=True)[1]  # best free gt of each prediction
+            pt, gt = pt[take], gt[take]
+            tp[pt, t] = True
+            matched[gt, t] = True
+            gt_score[gt, t] = scores[pt]
+    return tp, gt_score
+
+
+def _envelope(recall, precision):
+    # COCO-style: monotone precision envelope with sentinels
+    mrec = np.concatenate([[0.0], recall, [1.0]])
+    mpre = np.flip(np.maximum.accumulate(np.flip(np.concatenate([[1.0], precision, [0.0]]))))
+    return mrec, mpre
+
+
+class Evaluation:
+    """Metrics of one set of cached predictions; matching runs once, thresholds are free."""
+
+    def __init__(self, preds, iou_thresholds=IOU_THRESHOLDS):
+        self.preds = preds
+        self.names = {int(k): v for k, v in json.loads(str(preds["names"])).items()}
+        self.iou_thresholds = np.asarray(iou_thresholds)
+        self.tp, self.gt_score = match(preds, self.iou_thresholds)
+
+        order = np.argsort(-preds["pred_scores"], kind="stable")
+        self._scores = preds["pred_scores"][order]
+        self._tp = self.tp[order]
+        self._classes = preds["pred_classes"][order]
+        self.recall_grid = np.linspace(0, 1, 101)
+        self.ap = np.zeros((len(self.names), len(self.iou_thresholds)))
+        self.pr = {}  # class id → precision on recall_grid, first IoU threshold
+        self.present = []  # classes with ground truth; only these count towards mAP
+        for c in self.names:
+            n_gt = int((preds["gt_classes"] == c).sum())
+            if n_gt:
+                self.present.append(c)
+            tp = self._tp[self._classes == c]
+            if not n_gt or not len(tp):
+                self.pr[c] = np.zeros_like(self.recall_grid)
+                continue
+            tpc = np.cumsum(tp, axis=0)
+            recall = tpc / n_gt
+            precision = tpc / np.arange(1, len(tp) + 1)[:, None]
+            for t in range(len(self.iou_thresholds)):
+                mrec, mpre = _envelope(recall[:, t], precision[:, t])
+                curve = np.interp(self.recall_grid, mrec, mpre)
+                self.ap[c, t] = np.sum((curve[1:] + curve[:-1]) / 2 * np.diff(self.recall_grid))
+                if t == 0:
+                    self.pr[c] = curve
+
+    def _iou_index(self, iou):
+        return int(np.argmin(np.abs(self.iou_thresholds - iou)))
+
+    def summary(self):
+        i50 = self._iou_index(0.5)
+        ap = self.ap[self.present]
+        return {
+            "map50": float(ap[:, i50].mean()) if len(ap) else 0.0,
+            "map50_95": float(ap.mean()) if len(ap) else 0.0,
+            **{f"ap50/{self.names[c]}": float(self.ap[c, i50]) for c in self.present},
+        }
+
+    def sweep(self, confs, iou=0.5, cls=None):
+        """Precision / recall / F1 at every confidence in ``confs`` (all classes, or class id ``cls``)."""
+        t = self._iou_index(iou)
+        mask = np.ones(len(self._scores), dtype=bool) if cls is None else self._classes == cls
+        scores, tp = self._scores[mask], self._tp[mask, t]
+        n_gt = len(self.preds["gt_classes"]) if cls is None else int((self.preds["gt_classes"] == cls).sum())
+        confs = np.asarray(confs, dtype=np.float32)
+        kept = np.searchsorted(-scores, -confs, side="right")  # predictions with score ≥ conf
+        hits = np.concatenate([[0], np.cumsum(tp)])[kept]
+        precision = hits / np.maximum(kept, 1)
+        recall = hits / max(n_gt, 1)
+        f1 = 2 * precision * recall / np.maximum(precision + recall, 1e-9)
+        return pd.DataFrame({"conf": confs, "precision": precision, "recall": recall, "f1": f1,
+                             "detections": kept})
+
+    def best_conf(self, iou=0.5, cls=None):
+        table = self.sweep(np.linspace(0.01, 0.99, 99), iou=iou, cls=cls)
+        return round(float(table.loc[table["f1"].idxmax(), "conf"]), 2)
+
+    def size_recall(self, conf=0.25, iou=0.5):
+        """Recall per COCO object size bucket (by ground-truth box area in pixels)."""
+        found = self.gt_score[:, self._iou_index(iou)] >= conf
+        wh = self.preds["gt_boxes"][:, 2:] - self.preds["gt_boxes"][:, :2]
+        area = wh[:, 0] * wh[:, 1]
+        out = {}
+        for bucket, (low, high) in SIZE_BUCKETS.items():
+            in_bucket = (area >= low) & (area < high)
+            out[bucket] = {"recall": float(found[in_bucket].mean()) if in_bucket.any() else None,
+                           "objects": int(in_bucket.sum())}
+        return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare checkpoints and thresholds on cached predictions")
+    parser.add_argument("--weights", nargs="+", required=True, help="Checkpoints to evaluate")
+    parser.add_argument("--data", required=True, help="data.yaml of the dataset")
+    parser.add_argument("--split", default="val", help="Split to evaluate")
+    parser.add_argument("--imgsz", type=int, default=640, help="Inference size")
+    parser.add_argument("--conf", type=float, nargs="+", default=[0.1, 0.25, 0.4, 0.5], help="Confidences to sweep")
+    parser.add_argument("--iou", type=float, default=0.5, help="Match IoU for the sweep and size recall")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="Prediction cache")
+    args = parser.parse_args()
+
+    for weights in args.weights:
+        preds, _ = predict_split(weights, args.data, split=args.split, imgsz=args.imgsz, cache_dir=args.cache_dir)
+        evaluation = Evaluation(preds)
+        summary = evaluation.summary()
+        print(f"\n📊 {weights}: mAP50 {summary['map50']:.4f}  mAP50-95 {summary['map50_95']:.4f}  "
+              f"best-F1 conf {evaluation.best_conf(iou=args.iou):.2f}")
+        print(evaluation.sweep(args.conf, iou=args.iou).to_string(index=False, float_format="%.3f"))
+        for bucket, stats in evaluation.size_recall(conf=min(args.conf), iou=args.iou).items():
+            recall = "n/a" if stats["recall"] is None else f"{stats['recall']:.3f}"
+            print(f"   {bucket:<6} recall@{min(args.conf):.2f}: {recall} ({stats['objects']} objects)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# perf_metrics.py
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _escape(value):
+    # label values are user-controlled (stream names, drone ids)
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _fmt_labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name + self._fmt_labels(k), v) for k, v in self._values.items()]
+
+    def summary(self):
+        with self._lock:
+            return {k: {"total": v} for k, v in self._values.items()}
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        out = []
+        with self._lock:
+            items = [(k, list(c), s) for k, (c, s) in self._values.items()]
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                out.append((self.name + "_bucket" + self._fmt_labels(key, [("le", le)]), cumulative))
+            out.append((self.name + "_sum" + self._fmt_labels(key), total))
+            out.append((self.name + "_count" + self._fmt_labels(key), cumulative))
+        return out
+
+    def summary(self):
+        result = {}
+        with self._lock:
+            items = [(k, list(c), s) for k, (c, s) in self._values.items()]
+        for key, counts, total in items:
+            n = sum(counts)
+            # p95 as the upper bound of the bucket holding the 95th percentile
+            target, cumulative, p95 = 0.95 * n, 0, float("inf")
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                if cumulative >= target:
+                    p95 = bound
+                    break
+            result[key] = {"count": n, "mean": total / n if n else 0.0, "p95_le": p95}
+        return result
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._add(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._add(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self):
+        # Prometheus text exposition format 0.0.4
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name} {value}" for name, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def summary_rows(self):
+        # Flat rows for the dashboard's Performance panel
+        rows = []
+        for metric in self._metrics:
+            for key, values in metric.summary().items():
+                labels = ", ".join(f"{n}={v}" for n, v in zip(metric.labelnames, key) if v)
+                rows.append({"metric": metric.name, "labels": labels, **values})
+        return rows
+
+
+# Process-wide, like the model registry: every session and stream feeds the same metrics
+REGISTRY = MetricsRegistry()
+
+FRAMES = REGISTRY.counter(
+    "firewatch_frames_total", "Frames handled, by stream and pipeline stage", ["stream", "stage"])
+INFERENCE_LATENCY = REGISTRY.histogram(
+    "firewatch_inference_latency_seconds", "Model time per frame (amortised over a batch)", ["stream"])
+RENDER_LATENCY = REGISTRY.histogram(
+    "firewatch_render_latency_seconds", "Plot + encode + send time per displayed frame", ["stream"])
+QUEUE_DEPTH = REGISTRY.gauge(
+    "firewatch_queue_depth", "Frames waiting for the inference stage", ["stream"])
+INPUT_SIZE = REGISTRY.gauge(
+    "firewatch_input_size_pixels", "Model input size currently used for the stream", ["stream"])
+CASCADE_LATENCY = REGISTRY.histogram(
+    "firewatch_cascade_latency_seconds", "Model time per image in each cascade tier", ["tier"])
+CASCADE_FRAMES = REGISTRY.counter(
+    "firewatch_cascade_frames_total", "Frames screened, escalated to and confirmed by the cascade", ["outcome"])
+DETECTIONS_LOGGED = REGISTRY.counter(
+    "firewatch_detections_logged_total", "Fire events written to the event store", ["status"])
+
+# stage names PipelineStats counts that are frames (the rest are batches, seconds, ...)
+FRAME_STAGES = {"read", "inferred", "skipped", "rendered", "dropped_capture", "dropped_render"}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # keep scrapes out of the Streamlit log
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_http_server(port=9108, host="127.0.0.1"):
+    """Serve ``/metrics`` on a local port; safe to call on every Streamlit rerun."""
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _Handler)
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+        return _server.server_address
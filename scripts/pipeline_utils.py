@@ -0,0 +1,108 @@
+# pipeline_utils.py
+#
+# Lets the s*_*.py steps run either as ClearML tasks on the FireWatchQueue or
+# under the local executor (local_pipeline.py). Locally, each step gets its own
+# output folder in FIREWATCH_LOCAL_OUTPUT; artifacts and parameters are written
+# there, and the "task IDs" handed to downstream steps are those folders.
+import json
+import os
+import shutil
+
+LOCAL_ENV = "FIREWATCH_LOCAL_OUTPUT"
+INDEX = "artifacts.json"
+PARAMS = "parameters.json"
+
+# read once: a step may hide it from processes it spawns (see s4_hpo.py)
+_LOCAL_OUTPUT = os.environ.get(LOCAL_ENV)
+
+
+def local_output():
+    return _LOCAL_OUTPUT
+
+
+def is_local_ref(step_ref):
+    return os.path.isdir(str(step_ref))
+
+
+def _load(folder, name):
+    path = os.path.join(folder, name)
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save(folder, name, data):
+    tmp = os.path.join(folder, f"{name}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2, default=str)
+    os.replace(tmp, os.path.join(folder, name))
+
+
+def execute_remotely(task):
+    out = local_output()
+    if out is None:
+        task.execute_remotely()
+        return
+    # stay on this machine; remember the ClearML task so e.g. HPO can clone it
+    set_parameter(task, "task_id", task.id)
+
+
+def upload_artifact(task, name, artifact_object):
+    out = local_output()
+    if out is None:
+        task.upload_artifact(name=name, artifact_object=artifact_object)
+        return
+    index = _load(out, INDEX)
+    if isinstance(artifact_object, (str, os.PathLike)) and os.path.exists(artifact_object):
+        source = os.path.abspath(artifact_object)
+        if source.startswith(os.path.abspath(out) + os.sep):
+            stored = source  # already in this step's folder, nothing to copy
+        else:
+            stored = os.path.join(out, "artifacts", name, os.path.basename(source))
+            os.makedirs(os.path.dirname(stored), exist_ok=True)
+            if os.path.isdir(source):
+                shutil.copytree(source, stored, dirs_exist_ok=True)
+            else:
+                shutil.copy2(source, stored)
+    else:
+        stored = os.path.join(out, "artifacts", f"{name}.json")
+        os.makedirs(os.path.dirname(stored), exist_ok=True)
+        with open(stored, "w") as f:
+            json.dump(artifact_object, f, indent=2, default=str)
+    index[name] = os.path.relpath(stored, out)
+    _save(out, INDEX, index)
+
+
+def get_artifact(step_ref, name):
+    """Local path of artifact ``name`` of a ClearML task ID or a local step folder."""
+    if is_local_ref(step_ref):
+        index = _load(step_ref, INDEX)
+        if name not in index:
+            raise KeyError(f"No artifact {name!r} in {step_ref}")
+        return os.path.join(step_ref, index[name])
+    from clearml import Task
+
+    return Task.get_task(task_id=step_ref).artifacts[name].get_local_copy()
+
+
+def set_parameter(task, name, value):
+    out = local_output()
+    if out is not None:
+        params = _load(out, PARAMS)
+        params[name] = value
+        _save(out, PARAMS, params)
+    task.set_parameter(name, value)
+
+
+def get_parameter(step_ref, name, default=None):
+    if is_local_ref(step_ref):
+        return _load(step_ref, PARAMS).get(name, default)
+    from clearml import Task
+
+    return Task.get_task(task_id=step_ref).get_parameter(name, default)
+
+
+def clearml_task_id(step_ref):
+    # a ClearML task ID for both kinds of reference
+    return get_parameter(step_ref, "task_id") if is_local_ref(step_ref) else step_ref
@@ -1,17 +1,166 @@
+# preprocess.py
+#
+# Letterbox raw frames (and their YOLO labels) to a square training size, e.g.
+#   python scripts/preprocess.py --source raw_images/ --target data/train
+# Images go to <target>/images, labels to <target>/labels. Re-running only
+# touches files whose image/label content changed since the last run.
+import argparse
+import hashlib
+import json
 import os
-from PIL import Image
-import shutil
+from concurrent.futures import ProcessPoolExecutor
 
-# Example: convert and resize input images to YOLO-compatible folder
-source_folder = 'raw_images/'
-target_folder = 'data/train/images/'
+import cv2
+import numpy as np
 
-os.makedirs(target_folder, exist_ok=True)
+from dataset_utils import label_path, list_images
 
-for file_name in os.listdir(source_folder):
-    if file_name.endswith('.jpg'):
-        img = Image.open(os.path.join(source_folder, file_name))
-        resized = img.resize((640, 640))
-        resized.save(os.path.join(target_folder, file_name))
+MANIFEST = ".preprocess_manifest.json"
+PAD_VALUE = 114  # Ultralytics' letterbox grey
 
-print("Image preprocessing completed.")
+
+def letterbox(image, size, pad_value=PAD_VALUE):
+    # Fit inside size×size keeping the aspect ratio, pad the rest evenly
+    h, w = image.shape[:2]
+    scale = size / max(h, w)
+    new_w, new_h = round(w * scale), round(h * scale)
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    resized = cv2.resize(image, (new_w, new_h), interpolation=interpolation)
+    left, top = (size - new_w) // 2, (size - new_h) // 2
+    canvas = np.full((size, size, 3), pad_value, dtype=image.dtype)
+    canvas[top:top + new_h, left:left + new_w] = resized
+    return canvas, scale, (left, top)
+
+
+def rewrite_labels(text, shape, scale, pad, size):
+    # Normalised YOLO boxes (cls cx cy w h) or polygons (cls x1 y1 x2 y2 ...)
+    # on the original image → normalised coordinates on the letterboxed one
+    h, w = shape
+    lines = []
+    for line in text.splitlines():
+        values = line.split()
+        if not values:
+            continue
+        cls, coords = values[0], np.array(values[1:], dtype=np.float64)
+        if len(coords) == 4:
+            cx, cy, bw, bh = coords
+            coords = np.array([
+                (cx * w * scale + pad[0]) / size,
+                (cy * h * scale + pad[1]) / size,
+                bw * w * scale / size,
+                bh * h * scale / size,
+            ])
+        else:
+            xy = coords.reshape(-1, 2)
+            xy = (xy * (w, h) * scale + pad) / size
+            coords = xy.ravel()
+        lines.append(" ".join([cls] + [f"{v:.6f}" for v in coords]))
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def content_hash(image_bytes, label_bytes, settings):
+    digest = hashlib.sha1(settings.encode())
+    digest.update(image_bytes)
+    digest.update(b"\0" if label_bytes is None else label_bytes)
+    return digest.hexdigest()
+
+
+def process(src, dst_image, dst_label, size, previous):
+    # Runs in a worker process; returns (status, hash)
+    with open(src, "rb") as f:
+        image_bytes = f.read()
+    src_label = label_path(src)
+    label_bytes = None
+    if os.path.isfile(src_label):
+        with open(src_label, "rb") as f:
+            label_bytes = f.read()
+    digest = content_hash(image_bytes, label_bytes, f"letterbox:{size}:{PAD_VALUE}")
+    if digest == previous and os.path.exists(dst_image):
+        return "skipped", digest
+
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return "failed", None
+    boxed, scale, pad = letterbox(image, size)
+    os.makedirs(os.path.dirname(dst_image), exist_ok=True)
+    if not cv2.imwrite(dst_image, boxed):
+        return "failed", None
+    if label_bytes is not None:
+        os.makedirs(os.path.dirname(dst_label), exist_ok=True)
+        with open(dst_label, "w") as f:
+            f.write(rewrite_labels(label_bytes.decode(), image.shape[:2], scale, pad, size))
+    elif os.path.exists(dst_label):
+        os.remove(dst_label)  # the label was deleted upstream
+    return "processed", digest
+
+
+# ─── Manifest ──────────────────────────────────────────────────────────────────
+def load_manifest(path):
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(path, manifest):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel, incremental letterbox preprocessing")
+    parser.add_argument("--source", default="raw_images/", help="Folder of raw images (+ YOLO .txt labels)")
+    parser.add_argument("--target", default="data/train", help="Output split folder (images/ and labels/)")
+    parser.add_argument("--imgsz", type=int, default=640, help="Square output size")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    args = parser.parse_args()
+
+    manifest_path = os.path.join(args.target, MANIFEST)
+    manifest = load_manifest(manifest_path)
+
+    def outputs(rel):
+        stem = os.path.splitext(rel)[0]
+        return (os.path.join(args.target, "images", rel),
+                os.path.join(args.target, "labels", stem + ".txt"))
+
+    sources = {os.path.relpath(path, args.source): path for path in list_images(args.source)}
+    jobs = [(src, *outputs(rel), args.imgsz, manifest.get(rel)) for rel, src in sources.items()]
+
+    counts = {"processed": 0, "skipped": 0, "failed": 0, "removed": 0}
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        results = pool.map(process, *zip(*jobs), chunksize=16) if jobs else []
+        for i, ((rel, src), (status, digest)) in enumerate(zip(sources.items(), results), start=1):
+            counts[status] += 1
+            if status == "failed":
+                # drop the output of an earlier version too: it no longer matches the source
+                stale = [path for path in outputs(rel) if os.path.exists(path)]
+                for path in stale:
+                    os.remove(path)
+                print(f"⚠️  Could not read or write {src}" + (", removed its old output" if stale else ""))
+                manifest.pop(rel, None)
+            else:
+                manifest[rel] = digest
+            if i % 1000 == 0:
+                save_manifest(manifest_path, manifest)  # an interrupted run keeps its progress
+                print(f"→ {i}/{len(jobs)} images")
+
+    # outputs of sources that disappeared since the last run
+    for rel in set(manifest) - set(sources):
+        for path in outputs(rel):
+            if os.path.exists(path):
+                os.remove(path)
+        del manifest[rel]
+        counts["removed"] += 1
+
+    os.makedirs(args.target, exist_ok=True)
+    save_manifest(manifest_path, manifest)
+    print(
+        f"✅ Image preprocessing completed: {counts['processed']} processed, {counts['skipped']} unchanged, "
+        f"{counts['removed']} removed, {counts['failed']} failed → {args.target}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# resolution_controller.py
+import threading
+import time
+
+from perf_metrics import INPUT_SIZE
+
+LADDER = (320, 416, 512, 640)
+
+
+class ResolutionController:
+    """Picks the model input size for one stream so it keeps up with ``target_fps``.
+
+    Per-frame inference latency is smoothed with an EMA and compared with the
+    frame budget (``1 / target_fps``). The size steps one rung down the ladder
+    after ``patience`` consecutive frames over budget, and one rung up only once
+    the next rung's estimated cost (latency scales with pixel count) fits inside
+    ``headroom`` of the budget for as long — the gap between the two thresholds,
+    plus a ``cooldown`` after every step, keeps it from oscillating. While a fire
+    is being tracked it steps up regardless of the budget and never steps down.
+    """
+
+    def __init__(self, target_fps=15.0, ladder=LADDER, start=None, headroom=0.8, patience=5,
+                 cooldown=2.0, smoothing=0.2, name="main"):
+        self.ladder = tuple(sorted(ladder))
+        self.budget = 1.0 / target_fps
+        self.headroom = headroom
+        self.patience = patience
+        self.cooldown = cooldown
+        self.smoothing = smoothing
+        self.name = name
+        self.steps_up = 0
+        self.steps_down = 0
+        self._rung = self.ladder.index(start) if start in self.ladder else len(self.ladder) - 1
+        self._latency = None
+        self._over = 0
+        self._under = 0
+        self._changed_at = 0.0
+        self._lock = threading.Lock()
+        INPUT_SIZE.set(self.imgsz, stream=name)
+
+    @property
+    def imgsz(self):
+        return self.ladder[self._rung]
+
+    def _cost_at(self, rung):
+        return self._latency * (self.ladder[rung] / self.imgsz) ** 2
+
+    def _step(self, delta, now):
+        rung = self._rung + delta
+        # carry the estimate over so the new rung isn't judged on the old one's latency
+        self._latency = self._cost_at(rung)
+        self._rung = rung
+        self._over = self._under = 0
+        self._changed_at = now
+        if delta > 0:
+            self.steps_up += 1
+        else:
+            self.steps_down += 1
+        INPUT_SIZE.set(self.imgsz, stream=self.name)
+
+    def observe(self, latency, detecting=False):
+        """Feeds one frame's inference latency (seconds); returns the size to use next."""
+        now = time.monotonic()
+        with self._lock:
+            if self._latency is None:
+                self._latency = latency
+            else:
+                self._latency += self.smoothing * (latency - self._latency)
+            self._over = self._over + 1 if self._latency > self.budget else 0
+            top = self._rung == len(self.ladder) - 1
+            fits = not top and self._cost_at(self._rung + 1) <= self.headroom * self.budget
+            self._under = self._under + 1 if fits else 0
+
+            if now - self._changed_at >= self.cooldown:
+                if detecting:
+                    if not top:
+                        self._step(+1, now)
+                elif self._over >= self.patience and self._rung > 0:
+                    self._step(-1, now)
+                elif self._under >= self.patience:
+                    self._step(+1, now)
+            return self.imgsz
+
+    def stats(self):
+        return {
+            "imgsz": self.imgsz,
+            "latency_ms": 1000.0 * (self._latency or 0.0),
+            "budget_ms": 1000.0 * self.budget,
+            "steps_up": self.steps_up,
+            "steps_down": self.steps_down,
+        }
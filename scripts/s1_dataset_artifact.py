@@ -2,6 +2,8 @@
 import time
 from clearml import Task, StorageManager
 
+from pipeline_utils import execute_remotely, upload_artifact
+
 # ─── 1) Init ClearML Task ──────────────────────────────────────────────────────
 print("→ Initializing ClearML Task…")
 task = Task.init(
@@ -12,7 +14,7 @@ print(f"→ Task initialized: {task.id}")
 
 # ─── 2) Offload to remote agent ────────────────────────────────────────────────
 print("→ Offloading execution to remote agent…")
-task.execute_remotely()
+execute_remotely(task)
 
 # ─── 3) Download the ZIP from Google Drive ─────────────────────────────────────
 drive_url = (
@@ -26,10 +28,7 @@ print(f"✅ Download complete ({elapsed:.1f}s): {local_zip!r}")
 
 # ─── 4) Upload the ZIP as an artifact ──────────────────────────────────────────
 print("→ Uploading ZIP as artifact ‘raw_dataset_zip’…")
-task.upload_artifact(
-    name="raw_dataset_zip",
-    artifact_object=local_zip
-)
+upload_artifact(task, "raw_dataset_zip", local_zip)
 print("📦 Uploaded raw_dataset_zip")
 
 # ─── 5) Done ───────────────────────────────────────────────────────────────────
@@ -1,8 +1,16 @@
 # s2_preprocess_artifact.py
 import os
+import shutil
 import zipfile
+import zlib
 import argparse
-from clearml import Task, StorageManager
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from clearml import Dataset, Task
+
+from dataset_utils import check_dataset
+from pipeline_utils import execute_remotely, get_artifact, local_output, set_parameter, upload_artifact
 
 # 1) Parse CLI args
 parser = argparse.ArgumentParser()
@@ -10,6 +18,18 @@ parser.add_argument(
     "--dataset_task_id", required=True,
     help="Task ID from Step 1 (raw_dataset_zip)"
 )
+parser.add_argument(
+    "--workers", type=int, default=8,
+    help="Parallel extraction / validation threads"
+)
+parser.add_argument(
+    "--dataset_name", default="yolo_dataset",
+    help="ClearML Dataset the extracted files are versioned under"
+)
+parser.add_argument(
+    "--fail_on_corrupt", type=int, default=0,
+    help="Fail the step when corrupt images are found (0 = report only)"
+)
 args = parser.parse_args()
 
 # Explicit validation
@@ -24,25 +44,101 @@ task = Task.init(
 task.connect(vars(args))
 
 # 3) offload remotely
-task.execute_remotely()
+execute_remotely(task)
 
 # 4) Download the raw ZIP
-local_zip = StorageManager.get_local_copy(
-    task_id=args.dataset_task_id,
-    artifact_name="raw_dataset_zip"
-)
+local_zip = get_artifact(args.dataset_task_id, "raw_dataset_zip")
 print(f"✅ Downloaded raw zip to: {local_zip}")
 
-# 5) Unzip into ./yolo_data
+# 5) Unzip into ./yolo_data, members in parallel
 extract_dir = os.path.join(os.getcwd(), "yolo_data")
 os.makedirs(extract_dir, exist_ok=True)
-with zipfile.ZipFile(local_zip, "r") as zf:
-    zf.extractall(extract_dir)
-print(f"✅ Extracted contents to: {extract_dir}")
-
-# 6) Upload the extracted folder
-task.upload_artifact(
-    name="yolo_dataset",
-    artifact_object=extract_dir
-)
-print("📦 Uploaded yolo_dataset")
+
+
+def unchanged(path, info):
+    # an earlier extraction of the same member: same size and CRC-32
+    if not os.path.isfile(path) or os.path.getsize(path) != info.file_size:
+        return False
+    crc = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            crc = zlib.crc32(chunk, crc)
+    return crc == info.CRC
+
+
+def extract(members):
+    # Each thread reads through its own handle; ZipExtFile checks the CRC-32
+    # of every member as it is read and raises BadZipFile on a mismatch
+    extracted = 0
+    with zipfile.ZipFile(local_zip) as zf:
+        for info in members:
+            target = os.path.realpath(os.path.join(extract_dir, info.filename))
+            if not target.startswith(os.path.realpath(extract_dir) + os.sep):
+                raise ValueError(f"Refusing to extract outside {extract_dir}: {info.filename}")
+            if unchanged(target, info):
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with zf.open(info) as src, open(target, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+            extracted += 1
+    return extracted
+
+
+with zipfile.ZipFile(local_zip) as zf:
+    members = [info for info in zf.infolist() if not info.is_dir()]
+# largest first, dealt round-robin, so the threads finish at about the same time
+members.sort(key=lambda info: info.file_size, reverse=True)
+chunks = [members[i::args.workers] for i in range(args.workers)]
+with ThreadPoolExecutor(max_workers=args.workers) as pool:
+    extracted = sum(pool.map(extract, chunks))
+print(f"✅ Extracted {extracted} of {len(members)} files (CRC-checked) to: {extract_dir}")
+
+# 6) Validate image/label pairs
+report = check_dataset(extract_dir, workers=args.workers)
+summary = pd.DataFrame(
+    [{"problem": problem, "count": len(paths), "examples": ", ".join(
+        os.path.relpath(p, extract_dir) for p in paths[:5])} for problem, paths in report.items()]
+).set_index("problem")
+task.get_logger().report_table(title="dataset integrity", series="problems", iteration=0, table_plot=summary)
+for problem, paths in report.items():
+    task.get_logger().report_scalar(title="dataset integrity", series=problem, value=len(paths), iteration=0)
+    if paths:
+        print(f"⚠️  {len(paths)} {problem.replace('_', ' ')} (e.g. {os.path.relpath(paths[0], extract_dir)})")
+upload_artifact(task, "integrity_report", {
+    problem: [os.path.relpath(p, extract_dir) for p in paths] for problem, paths in report.items()
+})
+if args.fail_on_corrupt and report["corrupt_image"]:
+    raise RuntimeError(f"{len(report['corrupt_image'])} corrupt images in the dataset")
+
+# 7) Publish as a new dataset version holding only what changed since the last one
+if local_output():
+    # local executor: the step folder is already a content-addressed cache entry
+    upload_artifact(task, "yolo_dataset", extract_dir)
+    print(f"📦 yolo_dataset kept at {extract_dir}")
+else:
+    try:
+        parent = Dataset.get(
+            dataset_project="AlphaFirewatch", dataset_name=args.dataset_name, only_completed=True
+        )
+    except ValueError:
+        parent = None  # first version
+
+    dataset = Dataset.create(
+        dataset_project="AlphaFirewatch",
+        dataset_name=args.dataset_name,
+        parent_datasets=[parent.id] if parent else None,
+    )
+    removed, added, modified = dataset.sync_folder(local_path=extract_dir)
+    if parent is not None and not (removed or added or modified):
+        # identical content: point downstream steps at the existing version
+        Dataset.delete(dataset_id=dataset.id, force=True)
+        dataset = parent
+        print(f"✅ Dataset unchanged, reusing version {dataset.id}")
+    else:
+        dataset.upload()
+        dataset.finalize()
+        print(f"📦 Published {args.dataset_name} {dataset.id}: "
+              f"{added} added, {modified} modified, {removed} removed")
+
+    # downstream steps resolve this through dataset_utils.fetch_yolo_dataset
+    set_parameter(task, "Dataset/yolo_dataset_id", dataset.id)
@@ -1,8 +1,17 @@
 # s3_training.py
 import os
 import argparse
-from clearml import Task, StorageManager
+import numpy as np
+import torch
+from clearml import Task
 from ultralytics import YOLO
+from ultralytics.models.yolo.detect import DetectionTrainer
+
+from dataset_shards import ShardTrainer, pack_dataset
+from dataset_utils import fetch_yolo_dataset
+from offline_eval import Evaluation, predict_split
+from pipeline_utils import execute_remotely, get_artifact, upload_artifact
+from train_tuner import cap_batch, keep_workers, log_choice, tune
 
 # 1) Parse CLI args for ClearMl
 parser = argparse.ArgumentParser()
@@ -20,12 +29,52 @@ parser.add_argument(
 )
 parser.add_argument(
     "--batch", type=int, default=50,
-    help="Number in a batch"
+    help="Number in a batch (on CPU replaced by --tune_batch, or capped by --cap_batch)"
+)
+parser.add_argument(
+    "--workers", type=int, default=8,
+    help="Dataloader workers (used as is on GPU or with --tune_batch 0)"
+)
+parser.add_argument(
+    "--tune_batch", type=int, default=1,
+    help="On CPU, probe batch sizes and worker counts before training (0 = off)"
+)
+parser.add_argument(
+    "--cap_batch", type=int, default=1,
+    help="On CPU with --tune_batch 0, lower --batch to what fits the memory budget (0 = off)"
+)
+parser.add_argument(
+    "--mem_budget_gb", type=float, default=0,
+    help="Peak memory the probed settings may use (0 = 80%% of available RAM)"
 )
 parser.add_argument(
     "--imgsz", type=int, default=640,
     help="Image size"
 )
+parser.add_argument(
+    "--lr0", type=float, default=0.01,
+    help="Initial learning rate"
+)
+parser.add_argument(
+    "--aug_strength", type=float, default=1.0,
+    help="Scale of the default augmentation (0 = none, 1 = Ultralytics defaults)"
+)
+parser.add_argument(
+    "--shards", type=int, default=1,
+    help="Train from memory-mapped shards (0 = loose image/label files)"
+)
+parser.add_argument(
+    "--init_task_id", default="",
+    help="Step 3 task whose weights to start from instead of --model_arch (warm start)"
+)
+parser.add_argument(
+    "--init_weights", choices=["best_weights", "last_weights"], default="best_weights",
+    help="Which checkpoint of --init_task_id to start from"
+)
+parser.add_argument(
+    "--init_epochs", type=int, default=0,
+    help="Epochs already behind the starting checkpoint; only the remaining ones are trained"
+)
 args = parser.parse_args()
 
 # 2) Init ClearML Task
@@ -36,45 +85,106 @@ task = Task.init(
 task.connect(vars(args))
 
 # 3) offload remotely
-task.execute_remotely()
+execute_remotely(task)
 
 # 4) Fetch the prepped YOLO dataset
-local_data = StorageManager.get_local_copy(
-    task_id=args.dataset_task_id,
-    artifact_name="yolo_dataset"
-)
+local_data = fetch_yolo_dataset(args.dataset_task_id)
 
 data_yaml = os.path.join(local_data, "data.yaml")
 if not os.path.isfile(data_yaml):
     raise FileNotFoundError(f"data.yaml not found in {local_data}")
 print(f"✅ Loaded data.yaml from {data_yaml}")
 
-# 5) Train with Ultralytics
-model = YOLO(args.model_arch)
+# Pack into memory-mapped shards in the data cache (reused while unchanged)
+train_yaml, trainer = data_yaml, DetectionTrainer
+if args.shards:
+    # one pack per size: HPO trials with different imgsz may share this worker
+    train_yaml = pack_dataset(data_yaml, imgsz=args.imgsz)
+    trainer = ShardTrainer
 
+# 5) Train with Ultralytics, optionally warm-started from an earlier run's checkpoint
+weights = args.model_arch
+if args.init_task_id:
+    weights = get_artifact(args.init_task_id, args.init_weights)
+    print(f"♻️  Warm start from {args.init_weights} of {args.init_task_id} ({args.init_epochs} epochs in)")
+epochs = args.epochs - args.init_epochs
+if epochs < 1:
+    raise ValueError(f"--epochs {args.epochs} leaves nothing to train after --init_epochs {args.init_epochs}")
+model = YOLO(weights)
+
+# Probe batch size / dataloader workers on CPU agents, within the memory budget
+batch, workers = args.batch, args.workers
+if args.tune_batch and not torch.cuda.is_available():
+    choice, probes = tune(weights, train_yaml, imgsz=args.imgsz, trainer_cls=trainer, mem_budget_gb=args.mem_budget_gb)
+    log_choice(task, choice, probes)
+    batch, workers = choice["batch"], choice["workers"]
+    trainer = keep_workers(trainer)
+elif args.cap_batch and not torch.cuda.is_available():
+    # e.g. an HPO trial's sampled batch: kept unless it would thrash this agent
+    batch = cap_batch(weights, train_yaml, batch, imgsz=args.imgsz, trainer_cls=trainer,
+                      mem_budget_gb=args.mem_budget_gb)
+
+
+def report_epoch(trainer):
+    # per-epoch objective: lets the HPO scheduler stop weak trials early
+    map50 = trainer.metrics.get("metrics/mAP50(B)")
+    if map50 is not None:
+        task.get_logger().report_scalar(
+            title="train/metrics", series="val/mAP50", value=float(map50),
+            iteration=args.init_epochs + trainer.epoch + 1)
+
+
+model.add_callback("on_fit_epoch_end", report_epoch)
+
+aug = args.aug_strength
 results = model.train(
-    data=data_yaml,
-    epochs=args.epochs,
+    data=train_yaml,
+    trainer=trainer,
+    epochs=epochs,
     imgsz=args.imgsz,
+    batch=batch,
+    workers=workers,
+    lr0=args.lr0,
+    hsv_s=0.7 * aug,
+    hsv_v=0.4 * aug,
+    translate=0.1 * aug,
+    scale=0.5 * aug,
+    mosaic=min(1.0, aug),
     project="AlphaFirewatch",
     name="yolov11_training",
     exist_ok=True
 )
 
-val_results = model.val( data=data_yaml, imgsz=args.imgsz, batch=16,verbose=True )
-
-map50 = float(val_results.box.map50)
+# 6) Evaluate best.pt from its cached val predictions; threshold checks later reuse them
+run_dir = str(model.trainer.save_dir)  # e.g. AlphaFirewatch/yolov11_training
+preds, preds_path = predict_split(os.path.join(run_dir, "weights", "best.pt"), data_yaml, "val", imgsz=args.imgsz)
+evaluation = Evaluation(preds)
+summary = evaluation.summary()
+map50 = summary["map50"]
 
-task.get_logger().report_scalar( title="train/metrics", series="val/mAP50", value=map50, iteration=0)
+logger = task.get_logger()
+logger.report_scalar(title="train/metrics", series="val/mAP50", value=map50, iteration=args.epochs)
+logger.report_scalar(title="train/metrics", series="val/mAP50-95", value=summary["map50_95"], iteration=args.epochs)
+logger.report_table(title="val thresholds", series="conf sweep", iteration=0,
+                    table_plot=evaluation.sweep(np.arange(0.05, 1.0, 0.05)))
+for bucket, stats in evaluation.size_recall(conf=0.25).items():
+    if stats["recall"] is not None:
+        logger.report_scalar(title="val size recall", series=bucket, value=stats["recall"], iteration=args.epochs)
+for c, name in evaluation.names.items():
+    logger.report_scatter2d(title="val PR curve", series=name, iteration=0, mode="lines",
+                            scatter=np.column_stack([evaluation.recall_grid, evaluation.pr[c]]),
+                            xaxis="recall", yaxis="precision")
+upload_artifact(task, "val_predictions", preds_path)
+print(f"📊 val mAP50 {map50:.4f}, mAP50-95 {summary['map50_95']:.4f}")
 
-# 6) Upload best weights
-run_dir = model.run_dir  # e.g. runs/AlphaFirewatch/yolov8_training
-best_pt = os.path.join(run_dir, "weights", "best.pt")
-if os.path.isfile(best_pt):
-    task.upload_artifact(name="best_weights", artifact_object=best_pt)
-    print(f"✅ Uploaded best weights: {best_pt}")
-else:
-    print("⚠️  best.pt not found")
+# Upload best and last weights (HPO trials can warm-start from either)
+for name, filename in (("best_weights", "best.pt"), ("last_weights", "last.pt")):
+    path = os.path.join(run_dir, "weights", filename)
+    if os.path.isfile(path):
+        upload_artifact(task, name, path)
+        print(f"✅ Uploaded {name}: {path}")
+    else:
+        print(f"⚠️  {filename} not found")
 
 # 7) Emit this Task’s ID for CI chaining
 print(task.id)
@@ -1,12 +1,29 @@
 # s4_hpo.py
 import argparse
 import logging
+import os
 import time
 import json
 
-from clearml import Task, Dataset
+from clearml import Task
 from clearml.automation import HyperParameterOptimizer
-from clearml.automation import UniformIntegerParameterRange, UniformParameterRange
+from clearml.automation import (
+    DiscreteParameterRange,
+    LogUniformParameterRange,
+    UniformIntegerParameterRange,
+    UniformParameterRange,
+)
+
+from pipeline_utils import (
+    LOCAL_ENV,
+    clearml_task_id,
+    execute_remotely,
+    get_parameter,
+    is_local_ref,
+    local_output,
+    set_parameter,
+    upload_artifact,
+)
 
 # ─── Logging setup ─────────────────────────────────────────────────────────────
 logging.basicConfig(level=logging.INFO)
@@ -28,12 +45,33 @@ parser.add_argument(
 )
 parser.add_argument(
     "--epochs", type=int, default=50,
-    help="Upper bound for HPO search on number of epochs"
+    help="Epoch budget of a trial that survives every rung"
+)
+parser.add_argument(
+    "--min_epochs", type=int, default=5,
+    help="Epochs every trial gets before it can be stopped early"
+)
+parser.add_argument(
+    "--eta", type=int, default=3,
+    help="Successive-halving factor: 1/eta of the trials advance to each next rung"
+)
+parser.add_argument(
+    "--optimizer", choices=["optuna", "bohb"], default="optuna",
+    help="Hyperband scheduler: Optuna's HyperbandPruner or hpbandster's BOHB"
+)
+parser.add_argument(
+    "--warm_start", choices=["none", "best", "last"], default="none",
+    help="Start trials from the Step 3 baseline's best.pt, or continue from its last.pt "
+         "(the baseline's epochs count towards each trial's budget)"
 )
 parser.add_argument(
     "--time_limit_minutes", type=int, default=20,
     help="Overall HPO time limit (minutes)"
 )
+parser.add_argument(
+    "--patience_minutes", type=float, default=0,
+    help="Stop once the best val/mAP50 hasn't improved for this long (0 = never)"
+)
 parser.add_argument(
     "--test_queue", default="FireWatchQueue",
     help="Queue name for spawned trial tasks"
@@ -51,54 +89,122 @@ args = task.connect(args)
 logger.info("Connected parameters: %s", args)
 
 # ─── Offload optimizer to agent ────────────────────────────────────────────────
-task.execute_remotely()
-
-# Verify dataset artifact exists
-try:
-    ds = Dataset.get(dataset_id=args.dataset_task_id)
-    logger.info("Using dataset: %s (%s)", ds.name, args.dataset_task_id)
-except Exception as e:
-    logger.error("Failed to fetch dataset: %s", e)
-    raise
+execute_remotely(task)
+
+# Verify Step 2 published a dataset
+if is_local_ref(args.dataset_task_id):
+    logger.info("Using local dataset from %s", args.dataset_task_id)
+else:
+    dataset_id = get_parameter(args.dataset_task_id, "Dataset/yolo_dataset_id")
+    if not dataset_id:
+        raise RuntimeError(f"Step 2 task {args.dataset_task_id} did not publish a dataset")
+    logger.info("Using dataset %s from Step 2 task %s", dataset_id, args.dataset_task_id)
+
+# ─── Warm start from the Step 3 baseline ──────────────────────────────────────
+warm_start = {}
+first_epoch = 0
+if args.warm_start != "none":
+    warm_start = {
+        "Args/init_task_id": args.train_task_id,
+        "Args/init_weights": f"{args.warm_start}_weights",
+    }
+    if args.warm_start == "last":
+        # the baseline's epochs are the trials' common prefix
+        first_epoch = int(get_parameter(clearml_task_id(args.train_task_id), "Args/epochs"))
+        if first_epoch + args.min_epochs > args.epochs:
+            raise ValueError(f"Baseline already trained {first_epoch} of the {args.epochs} epoch budget")
+        warm_start["Args/init_epochs"] = first_epoch
+    logger.info("Warm-starting trials from %s of %s", warm_start["Args/init_weights"], args.train_task_id)
+
+# ─── Search space & scheduler ──────────────────────────────────────────────────
+# Every trial is configured for the full epoch budget; the scheduler stops weak
+# ones at the min_epochs · eta^k rungs from the val/mAP50 s3 reports each epoch
+# (counted from first_epoch when trials continue the baseline)
+space = [
+    DiscreteParameterRange("Args/imgsz", values=[416, 512, 640]),
+    UniformIntegerParameterRange("Args/batch", min_value=16, max_value=128, step_size=16),
+    UniformParameterRange("Args/aug_strength", min_value=0.0, max_value=1.5),
+]
+if args.optimizer == "optuna":
+    import optuna
+    from clearml.automation.optuna import OptimizerOptuna
+
+    optimizer_class = OptimizerOptuna
+    optimizer_kwargs = dict(optuna_pruner=optuna.pruners.HyperbandPruner(
+        min_resource=first_epoch + args.min_epochs, max_resource=args.epochs, reduction_factor=args.eta,
+    ))
+    space.append(LogUniformParameterRange("Args/lr0", min_value=-4, max_value=-1.5))
+else:
+    from clearml.automation.hpbandster import OptimizerBOHB
+
+    optimizer_class = OptimizerBOHB
+    optimizer_kwargs = dict(eta=args.eta)
+    # BOHB samples the range linearly (no log ranges)
+    space.append(UniformParameterRange("Args/lr0", min_value=0.0005, max_value=0.03))
 
-# ─── Configure HyperParameterOptimizer ────────────────────────────────────────
 hpo = HyperParameterOptimizer(
-    base_task_id=args.train_task_id,
-    hyper_parameters=[
-        # Tune number of epochs between 20 and max
-        UniformIntegerParameterRange(
-            "epochs",
-            min_value=20,
-            max_value=args.epochs  
-        ),
-        # Tune batch size between 16 and 64
-        UniformIntegerParameterRange("batch", min_value=16, max_value=128),
-    ],
+    base_task_id=clearml_task_id(args.train_task_id),
+    hyper_parameters=space,
     # This matches  YOLO validation logging:
     objective_metric_title="train/metrics",
     objective_metric_series="val/mAP50",
     objective_metric_sign="max",
+    optimizer_class=optimizer_class,
 
     max_number_of_concurrent_tasks=2,
     total_max_jobs=args.num_trials,
-    optimization_time_limit=args.time_limit_minutes * 60,
+    min_iteration_per_job=first_epoch + args.min_epochs,
+    max_iteration_per_job=args.epochs,
+    optimization_time_limit=args.time_limit_minutes,
     pool_period_min=1.0,
     execution_queue=args.test_queue,
     save_top_k_tasks_only=1,
 
-    # make sure each trial knows where to fetch data and queue
+    # make sure each trial knows where to fetch data and how long to train
     parameter_override={
-        "args.dataset_task_id": args.dataset_task_id,
-        "args.test_queue":       args.test_queue,
-    }
+        "Args/dataset_task_id": args.dataset_task_id,
+        "Args/epochs":          args.epochs,
+        # train with the sampled batch; the CPU batch tuner would replace it,
+        # step 3 only caps it to what fits the agent's memory (--cap_batch)
+        "Args/tune_batch":      0,
+        **warm_start,
+    },
+    **optimizer_kwargs
 )
 
-# Run & wait
-logger.info("Starting HPO: %d trials, %d min", args.num_trials, args.time_limit_minutes)
-hpo.start()
-time.sleep(args.time_limit_minutes * 60)
-logger.info("Time limit reached, stopping HPO")
+
+def best_objective():
+    top = hpo.get_top_experiments_details(top_k=1)
+    if not top:
+        return None
+    return next(iter(top[0]["metrics"].values()), {}).get("value")
+
+
+# Run until the search finishes, the time limit is hit or it stops improving
+logger.info("Starting %s HPO: %d trials, %d–%d epochs, %d min",
+            args.optimizer, args.num_trials, args.min_epochs, args.epochs, args.time_limit_minutes)
+if local_output():
+    # local executor: trials run as subprocesses here and report to ClearML as usual
+    # (not into this step's folder), reading the dataset from the Step 2 folder
+    os.environ.pop(LOCAL_ENV, None)
+    hpo.start_locally()
+else:
+    hpo.start()
+
+best_value, improved_at = None, time.monotonic()
+while not hpo.wait(timeout=1.0):
+    if hpo.reached_time_limit():
+        logger.info("Time limit reached")
+        break
+    value = best_objective()
+    if value is not None and (best_value is None or value > best_value):
+        logger.info("New best val/mAP50 %.4f after %.1f min", value, hpo.elapsed())
+        best_value, improved_at = value, time.monotonic()
+    elif args.patience_minutes and time.monotonic() - improved_at > args.patience_minutes * 60:
+        logger.info("No improvement for %.0f min, search converged", args.patience_minutes)
+        break
 hpo.stop()
+logger.info("HPO stopped after %.1f min", hpo.elapsed())
 
 # Retrieve best experiment
 top = hpo.get_top_experiments(top_k=1)
@@ -109,7 +215,7 @@ best = top[0]
 best_id = best.id
 best_params = best.get_parameters()
 metrics     = best.get_last_scalar_metrics()
-best_map50  = metrics.get("train/metrics", {}).get("val/mAP50", None)
+best_map50  = metrics.get("train/metrics", {}).get("val/mAP50", {}).get("last")
 
 logger.info(
     "Best trial %s → params: %s  val/mAP50=%.4f",
@@ -125,10 +231,10 @@ out = {
 with open("best_hpo_results.json", "w") as fp:
     json.dump(out, fp, indent=2)
 
-task.upload_artifact("best_hpo_results", "best_hpo_results.json")
-task.set_parameter("best_task_id",    best_id)
-task.set_parameter("best_map50",      best_map50)
-task.set_parameter("best_parameters", best_params)
+upload_artifact(task, "best_hpo_results", "best_hpo_results.json")
+set_parameter(task, "best_task_id",    best_id)
+set_parameter(task, "best_map50",      best_map50)
+set_parameter(task, "best_parameters", best_params)
 logger.info("Uploaded best_hpo_results.json and set task parameters")
 
 print("🎯 HPO complete.")
@@ -1,11 +1,21 @@
 # s5_final_training.py
 import argparse
+import ast
 import logging
 import os
 import json
 
-from clearml import Task, StorageManager
+import numpy as np
+import torch
+from clearml import Task
 from ultralytics import YOLO
+from ultralytics.models.yolo.detect import DetectionTrainer
+
+from dataset_shards import ShardTrainer, pack_dataset
+from dataset_utils import fetch_yolo_dataset
+from offline_eval import Evaluation, predict_split
+from pipeline_utils import execute_remotely, get_artifact, get_parameter, set_parameter, upload_artifact
+from train_tuner import cap_batch, keep_workers, log_choice, tune
 
 #  Logging setup 
 logging.basicConfig(level=logging.INFO)
@@ -41,6 +51,26 @@ parser.add_argument(
     "--conf_thres", type=float, default=0.25,
     help="YOLO confidence threshold",
 )
+parser.add_argument(
+    "--shards", type=int, default=1,
+    help="Train from memory-mapped shards (0 = loose image/label files)",
+)
+parser.add_argument(
+    "--workers", type=int, default=8,
+    help="Dataloader workers (used as is on GPU or with --tune_batch 0)",
+)
+parser.add_argument(
+    "--tune_batch", type=int, default=1,
+    help="On CPU, probe batch sizes and worker counts instead of using the HPO batch (0 = off)",
+)
+parser.add_argument(
+    "--cap_batch", type=int, default=1,
+    help="On CPU with --tune_batch 0, lower the HPO batch to what fits the memory budget (0 = off)",
+)
+parser.add_argument(
+    "--mem_budget_gb", type=float, default=0,
+    help="Peak memory the probed settings may use (0 = 80%% of available RAM)",
+)
 args = parser.parse_args()
 
 # Init ClearML Task
@@ -54,39 +84,84 @@ args = task.connect(args)
 logger.info("Connected parameters: %s", args)
 
 #  Offload to remote agent
-task.execute_remotely()
+execute_remotely(task)
 
 #  Retrieve best HPO parameters
-hpo_task = Task.get_task(task_id=args.hpo_task_id)
-best_params = hpo_task.get_parameter("best_parameters") or {}
+best_params = get_parameter(args.hpo_task_id, "best_parameters") or {}
+if isinstance(best_params, str):
+    # ClearML hands task parameters back as the repr of the dict
+    best_params = ast.literal_eval(best_params)
 if not best_params:
-    art = hpo_task.artifacts.get("best_hpo_results")
-    if art:
-        path = art.get_local_copy()
+    try:
+        path = get_artifact(args.hpo_task_id, "best_hpo_results")
+    except KeyError:
+        path = None
+    if path:
         with open(path, "r") as f:
-            best_params = json.load(f).get("parameters", {})
+            best_params = json.load(f).get("best_parameters", {})
 logger.info("Loaded best HPO parameters: %s", best_params)
 
-epochs = int(best_params.get("epochs", 50))
-batch  = int(best_params.get("batch", 16))
+
+
+def best(name, default):
+    # trial parameters come back as "Args/<name>" strings
+    for key in (f"Args/{name}", name):
+        if best_params.get(key) not in (None, ""):
+            return type(default)(best_params[key])
+    return default
+
+
+epochs       = best("epochs", 50)
+batch        = best("batch", 16)
+lr0          = best("lr0", 0.01)
+aug_strength = best("aug_strength", 1.0)
+imgsz        = best("imgsz", args.imgsz)
+logger.info("Final run: epochs=%d batch=%d lr0=%.5f aug_strength=%.2f imgsz=%d",
+            epochs, batch, lr0, aug_strength, imgsz)
 
 #  Fetch YOLO dataset
-data_dir = StorageManager.get_local_copy(
-    task_id=args.dataset_task_id,
-    artifact_name="yolo_dataset"
-)
+data_dir = fetch_yolo_dataset(args.dataset_task_id)
 data_yaml = os.path.join(data_dir, "data.yaml")
 if not os.path.isfile(data_yaml):
     raise FileNotFoundError(f"data.yaml not found under {data_dir}")
 logger.info("Loaded data.yaml from %s", data_yaml)
 
+#  Pack into memory-mapped shards in the data cache (reused while unchanged)
+trainer, val_yaml = DetectionTrainer, data_yaml
+if args.shards:
+    data_yaml = pack_dataset(data_yaml, imgsz=imgsz)
+    trainer = ShardTrainer
+    logger.info("Training from shards: %s", data_yaml)
+
+#  Probe batch size / dataloader workers on CPU agents, within the memory budget
+workers = args.workers
+if args.tune_batch and not torch.cuda.is_available():
+    choice, probes = tune(args.model_arch, data_yaml, imgsz=imgsz, trainer_cls=trainer,
+                          mem_budget_gb=args.mem_budget_gb)
+    log_choice(task, choice, probes)
+    logger.info("Batch tuner: batch %d → %d, workers %d", batch, choice["batch"], choice["workers"])
+    batch, workers = choice["batch"], choice["workers"]
+    trainer = keep_workers(trainer)
+elif args.cap_batch and not torch.cuda.is_available():
+    # the HPO batch, unless it would thrash this agent
+    batch = cap_batch(args.model_arch, data_yaml, batch, imgsz=imgsz, trainer_cls=trainer,
+                      mem_budget_gb=args.mem_budget_gb)
+
 #  Final YOLO training
 model = YOLO(args.model_arch)
 model.train(
     data=data_yaml,
+    trainer=trainer,
     epochs=epochs,
-    imgsz=args.imgsz,
+    imgsz=imgsz,
     batch=batch,
+    workers=workers,
+    lr0=lr0,
+    hsv_s=0.7 * aug_strength,
+    hsv_v=0.4 * aug_strength,
+    translate=0.1 * aug_strength,
+    scale=0.5 * aug_strength,
+    mosaic=min(1.0, aug_strength),
     project=args.project,
     name=args.name,
     exist_ok=True,
@@ -95,13 +170,29 @@ model.train(
 logger.info("Completed model.train() → runs/%s/%s", args.project, args.name)
 
 # ─── Upload final best.pt ───────────────────────────────────────────────────────
-best_pt = os.path.join(model.run_dir, "weights", "best.pt")
+best_pt = os.path.join(str(model.trainer.save_dir), "weights", "best.pt")
 if os.path.isfile(best_pt):
-    task.upload_artifact("final_best_weights", best_pt)
+    upload_artifact(task, "final_best_weights", best_pt)
     logger.info("Uploaded final best.pt: %s", best_pt)
 else:
     logger.warning("best.pt not found at %s", best_pt)
 
+# ─── Cached val predictions: conf_thres can be re-tuned without inference ─────
+if os.path.isfile(best_pt):
+    preds, preds_path = predict_split(best_pt, val_yaml, "val", imgsz=imgsz)
+    evaluation = Evaluation(preds)
+    summary = evaluation.summary()
+    table = evaluation.sweep(sorted({args.conf_thres, *np.round(np.arange(0.05, 1.0, 0.05), 2)}))
+    task.get_logger().report_table(title="val thresholds", series="conf sweep", iteration=0, table_plot=table)
+    upload_artifact(task, "val_predictions", preds_path)
+    set_parameter(task, "Eval/map50", summary["map50"])
+    set_parameter(task, "Eval/map50_95", summary["map50_95"])
+    set_parameter(task, "Eval/best_f1_conf", evaluation.best_conf())
+    at_conf = table[np.isclose(table["conf"], args.conf_thres)].iloc[0]
+    logger.info("val mAP50 %.4f, mAP50-95 %.4f; at conf %.2f: precision %.3f recall %.3f (best-F1 conf %.2f)",
+                summary["map50"], summary["map50_95"], args.conf_thres,
+                at_conf["precision"], at_conf["recall"], evaluation.best_conf())
+
 # ─── Emit Task ID for chaining ─────────────────────────────────────────────────
 print(task.id)
 
@@ -0,0 +1,147 @@
+# s6_export.py
+import argparse
+import logging
+import os
+import shutil
+
+import numpy as np
+from clearml import Task
+from ultralytics import YOLO
+
+from dataset_utils import fetch_yolo_dataset, sample_images
+from fire_tracker import iou_matrix
+from pipeline_utils import execute_remotely, get_artifact, upload_artifact
+
+#  Logging setup
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+#  Parse CLI args
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--dataset_task_id", required=True,
+    help="Task ID from Step 2 (yolo_dataset)",
+)
+parser.add_argument(
+    "--final_task_id", required=True,
+    help="Task ID from Step 5 (final_best_weights)",
+)
+parser.add_argument(
+    "--formats", default="onnx,openvino",
+    help="Comma-separated export formats (onnx, openvino)",
+)
+parser.add_argument(
+    "--imgsz", type=int, default=640,
+    help="Export / inference image size",
+)
+parser.add_argument(
+    "--parity_images", type=int, default=50,
+    help="Validation images used to compare exported vs. .pt outputs",
+)
+parser.add_argument(
+    "--parity_batch", type=int, default=8,
+    help="Batch size of the second parity pass (the dashboard batches uploads, fleets and tiles)",
+)
+parser.add_argument(
+    "--parity_imgsz", type=int, default=416,
+    help="Image size of the second parity pass (the resolution controller picks 320-512)",
+)
+parser.add_argument(
+    "--min_agreement", type=float, default=0.95,
+    help="Fraction of images whose detections must match the .pt model",
+)
+parser.add_argument(
+    "--conf_thres", type=float, default=0.25,
+    help="Confidence threshold for the parity check",
+)
+args = parser.parse_args()
+
+# Init ClearML Task
+task = Task.init(
+    project_name="AlphaFirewatch",
+    task_name="Step 6: Export Optimized Models",
+    task_type=Task.TaskTypes.data_processing,
+    reuse_last_task_id=False
+)
+args = task.connect(args)
+logger.info("Connected parameters: %s", args)
+
+#  Offload to remote agent
+execute_remotely(task)
+
+#  Fetch final weights and dataset
+best_pt = get_artifact(args.final_task_id, "final_best_weights")
+logger.info("Loaded final weights from %s", best_pt)
+# Ultralytics exports next to the weights: work on a private copy so the export
+# lands in this step's folder, not in Step 5's (shared with the sibling export step)
+best_pt = shutil.copy2(best_pt, os.path.abspath("best.pt"))
+
+data_dir = fetch_yolo_dataset(args.dataset_task_id)
+data_yaml = os.path.join(data_dir, "data.yaml")
+if not os.path.isfile(data_yaml):
+    raise FileNotFoundError(f"data.yaml not found under {data_dir}")
+images = sample_images(data_yaml, "val", n=args.parity_images)
+logger.info("Parity check on %d validation images", len(images))
+
+
+def detections_match(a, b, iou_thres=0.9, conf_tol=0.05):
+    # Same number of boxes, each with a near-identical box of the same class
+    if len(a) != len(b):
+        return False
+    if not len(a):
+        return True
+    ious = iou_matrix(a.xyxy.cpu().numpy(), b.xyxy.cpu().numpy())
+    best = ious.argmax(axis=1)
+    same_cls = a.cls.cpu().numpy() == b.cls.cpu().numpy()[best]
+    conf_diff = np.abs(a.conf.cpu().numpy() - b.conf.cpu().numpy()[best])
+    return bool(np.all(ious.max(axis=1) >= iou_thres) and np.all(same_cls) and np.all(conf_diff <= conf_tol))
+
+
+def predict_boxes(model, imgsz, batch):
+    boxes = []
+    for i in range(0, len(images), batch):
+        results = model.predict(images[i:i + batch], imgsz=imgsz, conf=args.conf_thres, device="cpu", verbose=False)
+        boxes.extend(result.boxes for result in results)
+    return boxes
+
+
+# one image at the export size, then batches at another size: the exports must
+# accept both, as the dashboard sends them either
+checks = [(args.imgsz, 1), (args.parity_imgsz, args.parity_batch)]
+reference = YOLO(best_pt)
+reference_results = {check: predict_boxes(reference, *check) for check in checks}
+
+#  Export each format and check it against the .pt model
+failed = []
+for fmt in [f.strip() for f in args.formats.split(",") if f.strip()]:
+    # dynamic batch and image size: the default static shape only takes one imgsz×imgsz image
+    exported = YOLO(best_pt).export(format=fmt, imgsz=args.imgsz, dynamic=True, device="cpu")
+    logger.info("Exported %s → %s", fmt, exported)
+
+    candidate = YOLO(exported, task="detect")
+    agreement = 1.0
+    for imgsz, batch in checks:
+        try:
+            boxes = predict_boxes(candidate, imgsz, batch)
+        except Exception as e:  # e.g. a shape the exported graph doesn't accept
+            logger.error("%s failed on batch=%d imgsz=%d: %s", fmt, batch, imgsz, e)
+            boxes = []
+        matches = sum(detections_match(ref, b) for ref, b in zip(reference_results[imgsz, batch], boxes))
+        check_agreement = matches / max(len(images), 1)
+        task.get_logger().report_scalar(
+            title="export/parity", series=f"{fmt} batch={batch} imgsz={imgsz}", value=check_agreement, iteration=0)
+        logger.info("%s agreement with .pt at batch=%d imgsz=%d: %.3f", fmt, batch, imgsz, check_agreement)
+        agreement = min(agreement, check_agreement)
+
+    if agreement < args.min_agreement:
+        failed.append(fmt)
+        logger.error("%s outputs diverge from the .pt model (%.3f < %.3f)", fmt, agreement, args.min_agreement)
+        continue
+    upload_artifact(task, f"{fmt}_model", exported)
+    logger.info("Uploaded %s_model", fmt)
+
+if failed:
+    raise RuntimeError(f"Exported model(s) failed the parity check: {', '.join(failed)}")
+
+# ─── Emit Task ID for chaining ─────────────────────────────────────────────────
+print(task.id)
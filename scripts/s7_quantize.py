@@ -0,0 +1,125 @@
+# s7_quantize.py
+import argparse
+import logging
+import os
+import shutil
+
+import pandas as pd
+import yaml
+from clearml import Task
+from ultralytics import YOLO
+
+from dataset_utils import fetch_yolo_dataset, sample_images
+from pipeline_utils import execute_remotely, get_artifact, set_parameter, upload_artifact
+
+#  Logging setup
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+#  Parse CLI args
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--dataset_task_id", required=True,
+    help="Task ID from Step 2 (yolo_dataset)",
+)
+parser.add_argument(
+    "--final_task_id", required=True,
+    help="Task ID from Step 5 (final_best_weights)",
+)
+parser.add_argument(
+    "--imgsz", type=int, default=640,
+    help="Export / validation image size",
+)
+parser.add_argument(
+    "--calib_images", type=int, default=300,
+    help="Validation images sampled for INT8 calibration",
+)
+parser.add_argument(
+    "--max_map_drop", type=float, default=0.02,
+    help="Largest acceptable mAP50 loss (absolute) before the INT8 model is rejected",
+)
+args = parser.parse_args()
+
+# Init ClearML Task
+task = Task.init(
+    project_name="AlphaFirewatch",
+    task_name="Step 7: INT8 Quantization",
+    task_type=Task.TaskTypes.data_processing,
+    reuse_last_task_id=False
+)
+args = task.connect(args)
+logger.info("Connected parameters: %s", args)
+
+#  Offload to remote agent
+execute_remotely(task)
+
+#  Fetch final weights and dataset
+best_pt = get_artifact(args.final_task_id, "final_best_weights")
+logger.info("Loaded final weights from %s", best_pt)
+# Ultralytics exports next to the weights: work on a private copy so the export
+# lands in this step's folder, not in Step 5's (shared with the sibling export step)
+best_pt = shutil.copy2(best_pt, os.path.abspath("best.pt"))
+
+data_dir = fetch_yolo_dataset(args.dataset_task_id)
+data_yaml = os.path.join(data_dir, "data.yaml")
+if not os.path.isfile(data_yaml):
+    raise FileNotFoundError(f"data.yaml not found under {data_dir}")
+
+#  Calibration set: a random sample of the validation split as an image list
+calib_list = os.path.abspath("calibration_images.txt")
+with open(calib_list, "w") as f:
+    f.write("\n".join(sample_images(data_yaml, "val", n=args.calib_images)))
+with open(data_yaml) as f:
+    calib_cfg = yaml.safe_load(f)
+calib_cfg.update({"path": "", "train": calib_list, "val": calib_list})
+calib_yaml = os.path.abspath("calibration.yaml")
+with open(calib_yaml, "w") as f:
+    yaml.safe_dump(calib_cfg, f)
+logger.info("Calibrating on %s", calib_list)
+
+#  FP32 and INT8 OpenVINO exports: same runtime and imgsz, so the comparison
+#  below measures the precision change alone
+fp32_model = YOLO(best_pt).export(format="openvino", imgsz=args.imgsz, device="cpu")
+logger.info("Exported FP32 model → %s", fp32_model)
+int8_model = YOLO(best_pt).export(
+    format="openvino", int8=True, data=calib_yaml, imgsz=args.imgsz, device="cpu"
+)
+logger.info("Exported INT8 model → %s", int8_model)
+
+
+def evaluate(weights):
+    # full validation split on CPU; speed is ms per image for each stage
+    metrics = YOLO(weights, task="detect").val(
+        data=data_yaml, imgsz=args.imgsz, batch=1, device="cpu", verbose=False
+    )
+    return float(metrics.box.map50), sum(metrics.speed.values())
+
+
+report = []
+for precision, weights in (("FP32", fp32_model), ("INT8", int8_model)):
+    map50, latency = evaluate(weights)
+    task.get_logger().report_scalar(title=f"{precision}/metrics", series="val/mAP50", value=map50, iteration=0)
+    task.get_logger().report_scalar(title=f"{precision}/metrics", series="latency_ms", value=latency, iteration=0)
+    report.append({"precision": precision, "val/mAP50": map50, "latency_ms": latency, "fps": 1000.0 / latency})
+    logger.info("%s: mAP50=%.4f  %.1f ms/frame", precision, map50, latency)
+
+table = pd.DataFrame(report).set_index("precision")
+table["mAP50 vs FP32"] = table["val/mAP50"] - table.at["FP32", "val/mAP50"]
+table["speed-up vs FP32"] = table.at["FP32", "latency_ms"] / table["latency_ms"]
+task.get_logger().report_table(title="quantization", series="OpenVINO FP32 vs INT8", iteration=0, table_plot=table)
+print(table.to_string())
+
+#  Promote only if accuracy held up
+map_drop = table.at["FP32", "val/mAP50"] - table.at["INT8", "val/mAP50"]
+promoted = map_drop <= args.max_map_drop
+set_parameter(task, "int8_promoted", promoted)
+if promoted:
+    upload_artifact(task, "int8_model", int8_model)
+    logger.info("Promoted INT8 model (mAP50 drop %.4f ≤ %.4f)", map_drop, args.max_map_drop)
+else:
+    logger.warning(
+        "Not promoting INT8 model: mAP50 drop %.4f exceeds %.4f", map_drop, args.max_map_drop
+    )
+
+# ─── Emit Task ID for chaining ─────────────────────────────────────────────────
+print(task.id)
@@ -0,0 +1,223 @@
+# stream_manager.py
+import queue
+import threading
+import time
+
+import cv2
+
+from motion_gate import REUSE
+from perf_metrics import INFERENCE_LATENCY, QUEUE_DEPTH
+from stream_pipeline import (
+    CaptureThread,
+    InferencePacket,
+    LatestFrameQueue,
+    PipelineStats,
+    reuse_result,
+)
+
+
+def parse_source(source):
+    # "0" → camera index 0; anything else is a file path or a network URL
+    source = str(source).strip()
+    return int(source) if source.isdigit() else source
+
+
+def is_live_source(source):
+    return isinstance(source, int) or "://" in source
+
+
+class DroneStream:
+    """One source tagged with a drone ID: its capture thread and its two queues."""
+
+    def __init__(self, drone_id, source, stop_event, frame_ready, gate=None, controller=None):
+        self.drone_id = drone_id
+        self.source = parse_source(source)
+        self.stats = PipelineStats(drone_id)
+        self.gate = gate
+        self.controller = controller
+        self.last_result = None
+        self.video_cap = cv2.VideoCapture(self.source)
+        if not self.video_cap.isOpened():
+            raise IOError(f"Cannot open source {source!r} for drone {drone_id}")
+        # files are replayed at their own frame rate so every stream behaves like a feed
+        pace_fps = None if is_live_source(self.source) else (self.video_cap.get(cv2.CAP_PROP_FPS) or 30)
+        self.frames = LatestFrameQueue(
+            1, drop_oldest=True, notify=frame_ready, on_drop=lambda: self.stats.incr("dropped_capture"))
+        self.results = LatestFrameQueue(
+            2, drop_oldest=True, on_drop=lambda: self.stats.incr("dropped_render"))
+        self.capture = CaptureThread(self.video_cap, self.frames, self.stats, stop_event, pace_fps=pace_fps)
+        self.capture.name = f"capture-{drone_id}"
+
+    @property
+    def finished(self):
+        return self.frames.closed and not len(self.frames)
+
+    def snapshot(self):
+        snap = self.stats.snapshot()
+        # inference_s and latency_s are summed over every served frame, reused or not
+        served = max(snap["inferred"] + snap.get("skipped", 0), 1)
+        snap["dropped"] = self.frames.dropped + self.results.dropped
+        snap["inference_ms"] = 1000.0 * snap.get("inference_s", 0.0) / served
+        # capture → result available for rendering
+        snap["latency_ms"] = 1000.0 * snap.get("latency_s", 0.0) / served
+        if self.controller is not None:
+            snap["imgsz"] = self.controller.imgsz
+        return snap
+
+
+class StreamManager:
+    """Serves many drone feeds from one process with one shared inference worker.
+
+    Every stream has its own capture thread and latest-frame-wins queue. A single
+    scheduler thread builds batches by taking at most one frame per stream per
+    pass, starting from a rotating offset, so a fast or high-FPS feed cannot
+    starve the others, and runs them through ``predict_fn`` in one call.
+
+    Streams with a resolution controller are inferred at the size it currently
+    picks: the batch is split into one ``predict_fn(images, imgsz=...)`` call
+    per distinct size.
+    """
+
+    def __init__(self, predict_fn, batch_size=8, max_wait=0.02):
+        self.predict_fn = predict_fn
+        self.batch_size = max(1, int(batch_size))
+        self.max_wait = max_wait
+        self.streams = []
+        self.error = None
+        self._stop = threading.Event()
+        self._frame_ready = threading.Event()
+        self._result_ready = threading.Event()
+        self._offset = 0
+        self._scheduler = threading.Thread(target=self._run, name="stream-scheduler", daemon=True)
+
+    def add(self, drone_id, source, gate=None, controller=None):
+        stream = DroneStream(
+            drone_id, source, self._stop, self._frame_ready, gate=gate, controller=controller)
+        self.streams.append(stream)
+        return stream
+
+    def start(self):
+        for stream in self.streams:
+            stream.capture.start()
+        self._scheduler.start()
+        return self
+
+    # ─── Scheduler (background thread) ─────────────────────────────────────────
+    def _collect(self):
+        batch = []
+        n = len(self.streams)
+        QUEUE_DEPTH.set(sum(len(stream.frames) for stream in self.streams), stream="fleet")
+        for k in range(n):
+            stream = self.streams[(self._offset + k) % n]
+            if len(batch) >= self.batch_size:
+                break
+            try:
+                frame = stream.frames.get(timeout=0)
+            except queue.Empty:
+                continue  # nothing new from this drone yet
+            if frame is None:
+                stream.results.close()
+                continue
+            batch.append((stream, frame))
+        self._offset = (self._offset + 1) % max(n, 1)
+        return batch
+
+    def _infer(self, batch):
+        # with a motion gate, a stream whose frame barely changed reuses its last result
+        reuse = [
+            stream.gate is not None
+            and stream.last_result is not None
+            and stream.gate.decide(frame.image) == REUSE
+            for stream, frame in batch
+        ]
+        groups = {}
+        for i, ((stream, frame), skip) in enumerate(zip(batch, reuse)):
+            if not skip:
+                imgsz = stream.controller.imgsz if stream.controller is not None else None
+                groups.setdefault(imgsz, []).append(i)
+        fresh = {}
+        start = time.perf_counter()
+        for imgsz, members in groups.items():
+            images = [batch[i][1].image for i in members]
+            results = self.predict_fn(images) if imgsz is None else self.predict_fn(images, imgsz=imgsz)
+            fresh.update(zip(members, results))
+        latency = (time.perf_counter() - start) / max(len(fresh), 1)
+
+        for i, ((stream, frame), skip) in enumerate(zip(batch, reuse)):
+            if skip:
+                result = reuse_result(stream.last_result, frame.image)
+                stream.stats.incr("skipped")
+            else:
+                result = stream.last_result = fresh[i]
+                stream.stats.incr("inferred")
+            stream.stats.incr("inference_s", latency)
+            stream.stats.incr("latency_s", time.time() - frame.captured_at)
+            INFERENCE_LATENCY.observe(latency, stream=stream.drone_id)
+            stream.results.put(InferencePacket(frame, result, latency))
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                if all(stream.finished for stream in self.streams):
+                    break
+                if not any(len(stream.frames) for stream in self.streams):
+                    self._frame_ready.wait(0.1)
+                    self._frame_ready.clear()
+                    # give the other feeds a moment to deliver so batches fill up
+                    if self.max_wait and len(self.streams) > 1:
+                        self._stop.wait(self.max_wait)
+                batch = self._collect()
+                if batch:
+                    self._infer(batch)
+                    self._result_ready.set()
+        except Exception as e:
+            self.error = e
+        finally:
+            for stream in self.streams:
+                stream.results.close()
+            self._result_ready.set()
+
+    # ─── Consumer side (Streamlit thread) ──────────────────────────────────────
+    def poll(self, timeout=0.1):
+        """Returns the ``(stream, packet)`` pairs ready now, waiting up to ``timeout``."""
+        self._result_ready.wait(timeout)
+        self._result_ready.clear()
+        ready = []
+        for stream in self.streams:
+            while True:
+                try:
+                    packet = stream.results.get(timeout=0)
+                except queue.Empty:
+                    break
+                if packet is None:
+                    break
+                stream.stats.incr("rendered")
+                ready.append((stream, packet))
+        return ready
+
+    @property
+    def running(self):
+        if self.error is not None:
+            raise self.error
+        return any(not (s.results.closed and not len(s.results)) for s in self.streams)
+
+    def snapshot(self):
+        return {stream.drone_id: stream.snapshot() for stream in self.streams}
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        for stream in self.streams:
+            stream.frames.close()
+            stream.results.close()
+        for thread in [self._scheduler] + [s.capture for s in self.streams]:
+            if thread.is_alive():
+                thread.join(timeout)
+        for stream in self.streams:
+            stream.video_cap.release()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
@@ -0,0 +1,326 @@
+# stream_pipeline.py
+import collections
+import copy
+import queue
+import threading
+import time
+
+import cv2
+
+from motion_gate import INFER, REUSE
+from perf_metrics import FRAME_STAGES, FRAMES, INFERENCE_LATENCY, QUEUE_DEPTH
+
+# A frame as it leaves the capture stage, and the same frame once inferred
+# position_ms is the source's own timestamp (0 for most live cameras)
+FramePacket = collections.namedtuple("FramePacket", "index captured_at position_ms image")
+InferencePacket = collections.namedtuple("InferencePacket", "frame result latency")
+
+
+# ─── Bounded hand-off queue ─────────────────────────────────────────────────────
+class LatestFrameQueue:
+    """Bounded queue between two pipeline stages.
+
+    With ``drop_oldest=True`` (live feeds) a full queue discards its oldest item,
+    so the consumer always gets the freshest frame. Otherwise ``put`` blocks until
+    the consumer catches up, which back-pressures file sources instead of losing
+    frames.
+    """
+
+    def __init__(self, maxsize=1, drop_oldest=True, notify=None, on_drop=None):
+        self.maxsize = max(1, int(maxsize))
+        self.drop_oldest = drop_oldest
+        self.on_drop = on_drop
+        # optional threading.Event set on every put/close, for consumers that
+        # wait on several queues at once
+        self.notify = notify
+        self.dropped = 0
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, item):
+        dropped = False
+        with self._cond:
+            while len(self._items) >= self.maxsize and not self._closed:
+                if self.drop_oldest:
+                    self._items.popleft()
+                    self.dropped += 1
+                    dropped = True
+                    break
+                self._cond.wait()
+            if self._closed:
+                return False
+            self._items.append(item)
+            self._cond.notify_all()
+        if dropped and self.on_drop is not None:
+            self.on_drop()
+        if self.notify is not None:
+            self.notify.set()
+        return True
+
+    def get(self, timeout=None):
+        # Returns None once the queue is closed and drained, raises queue.Empty on timeout
+        with self._cond:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not self._items:
+                if self._closed:
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+                self._cond.wait(remaining)
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self.notify is not None:
+            self.notify.set()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+
+# ─── Counters shared by all stages ─────────────────────────────────────────────
+class PipelineStats:
+    # Per-stream counters; frame counts are mirrored into the process-wide metrics
+    def __init__(self, name="main"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._counts = collections.Counter()
+        self.started = time.monotonic()
+
+    def incr(self, key, n=1):
+        with self._lock:
+            self._counts[key] += n
+        if key in FRAME_STAGES:
+            FRAMES.inc(n, stream=self.name, stage=key)
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self._counts)
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        for key in ("read", "inferred", "rendered"):
+            counts.setdefault(key, 0)
+            counts[f"{key}_fps"] = counts[key] / elapsed
+        counts["avg_batch"] = counts["inferred"] / max(counts.get("batches", 0), 1)
+        return counts
+
+
+# ─── Stage 1: capture ───────────────────────────────────────────────────────────
+class CaptureThread(threading.Thread):
+    # pace_fps replays a file at its native rate, so it behaves like a live feed
+    def __init__(self, video_cap, out_queue, stats, stop_event, pace_fps=None):
+        super().__init__(name="capture", daemon=True)
+        self.video_cap = video_cap
+        self.out_queue = out_queue
+        self.stats = stats
+        self.stop_event = stop_event
+        self.pace_fps = pace_fps
+        self.error = None
+
+    def run(self):
+        index = 0
+        next_due = time.monotonic()
+        try:
+            while not self.stop_event.is_set():
+                if self.pace_fps:
+                    next_due += 1.0 / self.pace_fps
+                    delay = next_due - time.monotonic()
+                    if delay > 0:
+                        self.stop_event.wait(delay)
+                success, image = self.video_cap.read()
+                if not success:
+                    break
+                self.stats.incr("read")
+                # a VideoReader reports the frame it returned, not where its stride left the capture
+                position_ms = self.video_cap.get(cv2.CAP_PROP_POS_MSEC) or 0.0
+                if not self.out_queue.put(FramePacket(index, time.time(), position_ms, image)):
+                    break
+                index += 1
+        except Exception as e:
+            self.error = e
+        finally:
+            self.out_queue.close()
+
+
+# ─── Stage 2: inference ─────────────────────────────────────────────────────────
+class InferenceWorker(threading.Thread):
+    """Pulls frames off ``in_queue`` and runs ``predict_fn`` on them in batches.
+
+    A batch is closed as soon as it holds ``batch_size`` frames or ``max_wait``
+    seconds have passed since its first frame arrived, whichever comes first.
+    ``predict_fn`` receives a list of images and must return one result per image;
+    results are forwarded in frame order. An optional ``MotionGate`` drops
+    near-duplicate frames from each batch before it reaches the model.
+    """
+
+    def __init__(self, predict_fn, in_queue, out_queue, stats, stop_event,
+                 batch_size=1, max_wait=0.0, gate=None):
+        super().__init__(name="inference", daemon=True)
+        self.predict_fn = predict_fn
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.stats = stats
+        self.stop_event = stop_event
+        self.batch_size = max(1, int(batch_size))
+        self.max_wait = max_wait
+        self.gate = gate
+        self._last_result = None
+        self.error = None
+
+    def _next_batch(self):
+        first = self.in_queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                frame = self.in_queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if frame is None:
+                break
+            batch.append(frame)
+        return batch
+
+    def _infer(self, batch):
+        # Returns one result per frame; with a motion gate only the frames it
+        # selects reach the model and the rest reuse the latest earlier result
+        if self.gate is None:
+            results = self.predict_fn([frame.image for frame in batch])
+            self._count_predict(len(batch))
+            return results
+
+        decisions = [self.gate.decide(frame.image) for frame in batch]
+        if self._last_result is None:
+            decisions[0] = INFER
+        selected = [frame.image for frame, d in zip(batch, decisions) if d != REUSE]
+        fresh = iter(self.predict_fn(selected) if selected else [])
+        self._count_predict(len(selected))
+
+        results = []
+        for frame, decision in zip(batch, decisions):
+            if decision == REUSE:
+                results.append(reuse_result(self._last_result, frame.image))
+            else:
+                self._last_result = next(fresh)
+                results.append(self._last_result)
+        self.stats.incr("skipped", decisions.count(REUSE))
+        return results
+
+    def _count_predict(self, n):
+        # only frames that reach the model count as inferred; reused ones are "skipped"
+        if n:
+            self.stats.incr("inferred", n)
+            self.stats.incr("batches")
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                batch = self._next_batch()
+                if not batch:
+                    break
+                start = time.perf_counter()
+                results = self._infer(batch)
+                # amortised per-frame latency
+                latency = (time.perf_counter() - start) / len(batch)
+                QUEUE_DEPTH.set(len(self.in_queue), stream=self.stats.name)
+                for frame, result in zip(batch, results):
+                    INFERENCE_LATENCY.observe(latency, stream=self.stats.name)
+                    if not self.out_queue.put(InferencePacket(frame, result, latency)):
+                        return
+        except Exception as e:
+            self.error = e
+        finally:
+            self.out_queue.close()
+            # unblock a capture thread waiting on a full queue
+            self.in_queue.close()
+
+
+def reuse_result(result, image):
+    # Same boxes, drawn over the current frame when plotted
+    reused = copy.copy(result)
+    reused.orig_img = image
+    return reused
+
+
+# ─── Stage 3: render (caller's thread) ─────────────────────────────────────────
+class StreamPipeline:
+    """Capture → inference → render, each stage on its own thread.
+
+    The capture and inference stages run in the background; iterating over the
+    pipeline yields ``InferencePacket`` objects on the caller's thread, which is
+    where Streamlit rendering has to happen. Live sources use latest-frame-wins
+    queues so a slow stage drops stale frames instead of falling behind real time;
+    file sources block so every decoded frame is inferred.
+    """
+
+    def __init__(self, video_cap, predict_fn, live=True, queue_size=1,
+                 batch_size=1, max_wait=0.0, gate=None, name="main"):
+        self.stats = PipelineStats(name)
+        self._stop = threading.Event()
+        # a batch has to fit in the queue or the capture stage would stall it
+        queue_size = max(queue_size, batch_size)
+        self.frames = LatestFrameQueue(
+            queue_size, drop_oldest=live, on_drop=lambda: self.stats.incr("dropped_capture"))
+        self.results = LatestFrameQueue(
+            queue_size, drop_oldest=live, on_drop=lambda: self.stats.incr("dropped_render"))
+        self.capture = CaptureThread(video_cap, self.frames, self.stats, self._stop)
+        self.inference = InferenceWorker(
+            predict_fn, self.frames, self.results, self.stats, self._stop,
+            batch_size=batch_size, max_wait=max_wait, gate=gate,
+        )
+        self.gate = gate
+
+    def start(self):
+        self.capture.start()
+        self.inference.start()
+        return self
+
+    def __iter__(self):
+        while True:
+            packet = self.results.get()
+            if packet is None:
+                break
+            yield packet
+            self.stats.incr("rendered")
+        for stage in (self.capture, self.inference):
+            if stage.error is not None:
+                raise stage.error
+
+    def snapshot(self):
+        snap = self.stats.snapshot()
+        snap["dropped_capture"] = self.frames.dropped
+        snap["dropped_render"] = self.results.dropped
+        snap["queue_depth"] = len(self.frames)
+        if self.gate is not None:
+            snap.update(self.gate.stats())
+        return snap
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        self.frames.close()
+        self.results.close()
+        for stage in (self.capture, self.inference):
+            if stage.is_alive():
+                stage.join(timeout)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
@@ -0,0 +1,151 @@
+# tiled_inference.py
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+from fire_tracker import iou_matrix
+
+FULL = "full"  # every frame is cut into an overlapping grid of tiles
+ROI = "roi"    # only windows around coarse full-frame candidates are re-inspected
+
+
+def tile_windows(height, width, tile_size=640, overlap=0.2):
+    # Evenly spaced (x1, y1, x2, y2) windows covering the frame, neighbours
+    # overlapping by at least `overlap` of a tile
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        step = tile_size * (1.0 - overlap)
+        n = int(np.ceil((length - tile_size) / step)) + 1
+        return [round(i * (length - tile_size) / (n - 1)) for i in range(n)]
+
+    return [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in starts(height) for x in starts(width)
+    ]
+
+
+def roi_windows(boxes, scores, height, width, tile_size=640, max_rois=4):
+    # One tile-sized window centred on each candidate, best first; candidates
+    # already inside a chosen window don't get their own
+    windows = []
+    for i in np.argsort(-scores):
+        x1, y1, x2, y2 = boxes[i]
+        if any(wx1 <= x1 and wy1 <= y1 and x2 <= wx2 and y2 <= wy2 for wx1, wy1, wx2, wy2 in windows):
+            continue
+        cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+        wx1 = int(np.clip(cx - tile_size / 2, 0, max(width - tile_size, 0)))
+        wy1 = int(np.clip(cy - tile_size / 2, 0, max(height - tile_size, 0)))
+        windows.append((wx1, wy1, min(wx1 + tile_size, width), min(wy1 + tile_size, height)))
+        if len(windows) >= max_rois:
+            break
+    return windows
+
+
+def nms(boxes, scores, classes, iou_threshold=0.5):
+    # Class-aware greedy NMS; returns kept indices, highest score first
+    keep = []
+    order = np.argsort(-scores)
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        overlap = iou_matrix(boxes[i:i + 1], boxes[rest])[0]
+        order = rest[(overlap < iou_threshold) | (classes[rest] != classes[i])]
+    return np.array(keep, dtype=int)
+
+
+def boxes_array(result, offset=(0, 0)):
+    # (N, 6) xyxy/conf/cls in frame coordinates for a result on a crop at `offset`
+    data = result.boxes.data.cpu().numpy().copy()
+    data[:, [0, 2]] += offset[0]
+    data[:, [1, 3]] += offset[1]
+    return data
+
+
+def make_result(frame, data, names):
+    return Results(orig_img=frame, path="", names=names, boxes=torch.from_numpy(data))
+
+
+class TiledPredictor:
+    """Sliced inference for frames much larger than the model's input size.
+
+    In ``full`` mode each frame is cut into overlapping ``tile_size`` tiles,
+    which go through the model together with a downscaled copy of the whole
+    frame (so fires larger than a tile are still seen in one piece); in ``roi``
+    mode the whole frame is inferred first at a low threshold and only up to
+    ``max_rois`` windows around its candidates are inferred at full resolution,
+    so the cost per frame is bounded. Tile boxes are shifted back to frame
+    coordinates and merged with class-aware NMS across tiles.
+
+    Called like a pipeline ``predict_fn``: a list of frames in, one Ultralytics
+    ``Results`` per frame out.
+    """
+
+    def __init__(self, model, mode=FULL, tile_size=640, overlap=0.2, conf=0.25, device=None,
+                 roi_conf=0.1, max_rois=4, nms_iou=0.5):
+        self.model = model
+        self.mode = mode
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.conf = conf
+        self.device = device
+        self.roi_conf = min(roi_conf, conf)
+        self.max_rois = max_rois
+        self.nms_iou = nms_iou
+        self.tiles_inferred = 0
+        self.frames_inferred = 0
+
+    def _predict(self, images, conf):
+        if not images:
+            return []
+        return self.model.predict(
+            source=images, conf=conf, imgsz=self.tile_size, device=self.device, verbose=False
+        )
+
+    def _windows(self, frames, coarse):
+        if self.mode == FULL:
+            return [tile_windows(*frame.shape[:2], self.tile_size, self.overlap) for frame in frames]
+        windows = []
+        for frame, result in zip(frames, coarse):
+            data = boxes_array(result)
+            windows.append(roi_windows(data[:, :4], data[:, 4], *frame.shape[:2],
+                                       self.tile_size, self.max_rois))
+        return windows
+
+    def __call__(self, frames):
+        frames = list(frames)
+        # full-frame pass: part of the tile batch in full mode, candidate search in ROI mode
+        coarse = self._predict(frames, self.roi_conf) if self.mode == ROI else None
+        windows = self._windows(frames, coarse)
+
+        crops, owners = [], []
+        for i, (frame, frame_windows) in enumerate(zip(frames, windows)):
+            if self.mode == FULL and len(frame_windows) > 1:
+                crops.append(frame)
+                owners.append((i, None))
+            for x1, y1, x2, y2 in frame_windows:
+                crops.append(frame[y1:y2, x1:x2])
+                owners.append((i, (x1, y1)))
+        tiled = self._predict(crops, self.conf)
+        self.tiles_inferred += len(crops)
+        self.frames_inferred += len(frames)
+
+        per_frame = [[] for _ in frames]
+        if coarse is not None:
+            for i, result in enumerate(coarse):
+                data = boxes_array(result)
+                per_frame[i].append(data[data[:, 4] >= self.conf])
+        for (i, offset), result in zip(owners, tiled):
+            per_frame[i].append(boxes_array(result, offset or (0, 0)))
+
+        results = []
+        for frame, parts in zip(frames, per_frame):
+            data = np.concatenate(parts) if parts else np.zeros((0, 6), dtype=np.float32)
+            if len(data):
+                data = data[nms(data[:, :4], data[:, 4], data[:, 5], self.nms_iou)]
+            results.append(make_result(frame, data, self.model.names))
+        return results
+
+    def stats(self):
+        return {"tiles_per_frame": self.tiles_inferred / max(self.frames_inferred, 1)}
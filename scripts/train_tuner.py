@@ -0,0 +1,237 @@
+# train_tuner.py
+#
+# Picks the batch size and dataloader worker count for CPU training. Each
+# candidate trains a few batches in a fresh process while the RSS of that
+# process and its dataloader workers is sampled; the fastest combination whose
+# peak fits the memory budget wins, e.g.
+#   choice, probes = tune("yolo11n.pt", "data.yaml", imgsz=640)
+#   model.train(..., batch=choice["batch"], workers=choice["workers"], trainer=keep_workers(DetectionTrainer))
+# A batch chosen elsewhere (e.g. sampled by HPO) can instead be capped to what fits:
+#   batch = cap_batch("yolo11n.pt", "data.yaml", 128, imgsz=640)
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import psutil
+
+BATCHES = (4, 8, 16, 32, 64)
+WORKERS = (0, 2, 4, 8)
+MIN_GAIN = 1.05  # a bigger batch / more workers must be this much faster to be worth it
+RESULT = "PROBE_RESULT "
+PEAKS_FILE = "batch_peaks.json"
+
+
+def keep_workers(trainer_cls):
+    """``trainer_cls`` without Ultralytics' rule that CPU training uses ``workers=0``."""
+
+    class WorkersTrainer(trainer_cls):
+        def __init__(self, cfg=None, overrides=None, _callbacks=None):
+            from ultralytics.utils import DEFAULT_CFG
+
+            super().__init__(cfg or DEFAULT_CFG, overrides, _callbacks)
+            if overrides and "workers" in overrides:
+                self.args.workers = int(overrides["workers"])
+
+    WorkersTrainer.__name__ = trainer_cls.__name__
+    return WorkersTrainer
+
+
+class PeakRSS:
+    """Tracks the peak RSS of this process plus its children in a background thread."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def sample(self):
+        proc = psutil.Process()
+        total = 0
+        for p in [proc] + proc.children(recursive=True):
+            try:
+                total += p.memory_info().rss
+            except psutil.Error:
+                pass  # a worker exiting between listing and reading
+        self.peak = max(self.peak, total)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        self.sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+
+def _class_path(cls):
+    return f"{cls.__module__}:{cls.__qualname__}" if cls else ""
+
+
+def _load_class(path):
+    if not path:
+        from ultralytics.models.yolo.detect import DetectionTrainer
+
+        return DetectionTrainer
+    module, name = path.split(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def _probe(weights, data, imgsz, batch, workers, trainer, warmup, steps):
+    # runs in its own interpreter (see __main__), so every candidate starts from a clean heap
+    with tempfile.TemporaryDirectory() as tmp, PeakRSS() as rss:
+        trainer = keep_workers(_load_class(trainer))(overrides=dict(
+            model=weights, data=data, imgsz=imgsz, batch=batch, workers=workers, device="cpu",
+            epochs=1, val=False, plots=False, verbose=False, project=tmp, name="probe",
+        ))
+        trainer.callbacks = defaultdict(list)  # no ClearML/HUB logging from a probe
+        trainer._setup_train(world_size=1)
+        trainer.model.train()
+        seen, start = 0, None
+        for i, batch_data in enumerate(trainer.train_loader):
+            if i == warmup:  # the first batches include worker start-up
+                start = time.perf_counter()
+            batch_data = trainer.preprocess_batch(batch_data)
+            loss, _ = trainer.model(batch_data)
+            loss.backward()
+            trainer.optimizer.step()
+            trainer.optimizer.zero_grad()
+            if start is not None:
+                seen += len(batch_data["img"])
+            if i + 1 >= warmup + steps:
+                break
+        elapsed = time.perf_counter() - start if start is not None else 0.0
+    return {"images_per_s": seen / elapsed if elapsed else 0.0, "peak_rss_gb": rss.peak / 2**30}
+
+
+def _run_probe(spec):
+    # a fresh `python train_tuner.py --probe`: never re-imports the calling step script
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--probe", json.dumps(spec)],
+                          stdout=subprocess.PIPE, text=True)
+    lines = [line for line in proc.stdout.splitlines() if line.startswith(RESULT)]
+    if proc.returncode == 0 and lines:
+        return json.loads(lines[-1][len(RESULT):])
+    # killed (most likely out of memory) or crashed
+    print(f"⚠️  Probe batch={spec['batch']} workers={spec['workers']} failed with exit code {proc.returncode}")
+    return {"images_per_s": 0.0, "peak_rss_gb": float("inf")}
+
+
+def tune(weights, data, imgsz=640, trainer_cls=None, mem_budget_gb=None,
+         batches=BATCHES, workers=WORKERS, warmup=2, steps=5):
+    """Probe batch sizes, then worker counts; returns ``(choice, probes)``.
+
+    Batch sizes are tried in increasing order (at a middle worker count) until
+    one no longer fits ``mem_budget_gb`` or stops paying off, then worker
+    counts at the best batch. The default budget is 80% of the memory that is
+    available now. ``choice`` is the fastest probe that fits, preferring the
+    one with less memory when two are within a few percent of each other.
+    """
+    if not mem_budget_gb:
+        mem_budget_gb = 0.8 * psutil.virtual_memory().available / 2**30
+    workers = sorted({w for w in workers if w <= (os.cpu_count() or 1)})
+    probes = []
+
+    def run(batch, nw):
+        result = _run_probe(dict(weights=weights, data=data, imgsz=imgsz, batch=batch, workers=nw,
+                                 trainer=_class_path(trainer_cls), warmup=warmup, steps=steps))
+        result.update(batch=batch, workers=nw, fits=result["peak_rss_gb"] <= mem_budget_gb)
+        probes.append(result)
+        print(f"🔎 batch={batch:<3} workers={nw}: {result['images_per_s']:.1f} img/s, "
+              f"peak {result['peak_rss_gb']:.2f} GB{'' if result['fits'] else ' (over budget)'}")
+        return result
+
+    base_workers = workers[len(workers) // 2]
+    best = None
+    for batch in sorted(batches):
+        result = run(batch, base_workers)
+        if not result["fits"]:
+            break
+        if best is not None and result["images_per_s"] < best["images_per_s"] * MIN_GAIN:
+            break
+        best = result
+    if best is None:
+        print(f"⚠️  No batch size fits {mem_budget_gb:.1f} GB, using the smallest")
+        return {"batch": min(batches), "workers": 0, "mem_budget_gb": mem_budget_gb}, probes
+    for nw in workers:
+        if nw != base_workers:
+            run(best["batch"], nw)
+
+    fitting = [p for p in probes if p["fits"]]
+    fastest = max(p["images_per_s"] for p in fitting)
+    choice = min((p for p in fitting if p["images_per_s"] * MIN_GAIN >= fastest), key=lambda p: p["peak_rss_gb"])
+    choice = dict(choice, mem_budget_gb=mem_budget_gb)
+    print(f"✅ Training with batch={choice['batch']} workers={choice['workers']} "
+          f"({choice['images_per_s']:.1f} img/s, peak {choice['peak_rss_gb']:.2f} of {mem_budget_gb:.1f} GB)")
+    return choice, probes
+
+
+def cap_batch(weights, data, batch, imgsz=640, trainer_cls=None, mem_budget_gb=None,
+              batches=BATCHES, warmup=1, steps=2):
+    """``batch``, or the largest smaller candidate whose peak memory fits ``mem_budget_gb``.
+
+    For a batch picked elsewhere, e.g. sampled by HPO. Training uses no
+    dataloader workers here (Ultralytics' CPU default). Peaks are probed once
+    per machine, model file, imgsz and trainer and kept next to the dataset
+    cache, so later trials only look them up.
+    """
+    from dataset_utils import data_cache_dir, file_lock
+
+    if not mem_budget_gb:
+        mem_budget_gb = 0.8 * psutil.virtual_memory().available / 2**30
+    candidates = sorted({b for b in batches if b < batch} | {batch}, reverse=True)
+    key = f"{os.path.basename(str(weights))}|{imgsz}|{_class_path(trainer_cls)}"
+    path = os.path.join(data_cache_dir(), PEAKS_FILE)
+    # one agent's trials wait for each other's probes instead of repeating them
+    with file_lock(path + ".lock"):
+        cache = {}
+        if os.path.isfile(path):
+            with open(path) as f:
+                cache = json.load(f)
+        peaks = cache.setdefault(key, {})
+        for candidate in candidates:
+            if str(candidate) not in peaks:
+                result = _run_probe(dict(weights=str(weights), data=data, imgsz=imgsz, batch=candidate, workers=0,
+                                         trainer=_class_path(trainer_cls), warmup=warmup, steps=steps))
+                peaks[str(candidate)] = result["peak_rss_gb"]
+                with open(path, "w") as f:
+                    json.dump(cache, f)
+            if peaks[str(candidate)] <= mem_budget_gb:
+                if candidate < batch:
+                    print(f"⚠️  batch={batch} doesn't fit {mem_budget_gb:.1f} GB, training with batch={candidate} "
+                          f"(peak {peaks[str(candidate)]:.2f} GB)")
+                return candidate
+    print(f"⚠️  No batch size fits {mem_budget_gb:.1f} GB, using the smallest")
+    return candidates[-1]
+
+
+def log_choice(task, choice, probes):
+    """Probe table and the chosen settings on the ClearML task (``Tuner/...``)."""
+    import pandas as pd
+
+    from pipeline_utils import set_parameter
+
+    if probes:
+        table = pd.DataFrame(probes)[["batch", "workers", "images_per_s", "peak_rss_gb", "fits"]]
+        task.get_logger().report_table(title="batch tuner", series="probes", iteration=0, table_plot=table)
+    for name in ("batch", "workers", "mem_budget_gb"):
+        set_parameter(task, f"Tuner/{name}", choice[name])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="One batch/worker probe (run by tune())")
+    parser.add_argument("--probe", required=True, help="JSON probe spec")
+    spec = json.loads(parser.parse_args().probe)
+    print(RESULT + json.dumps(_probe(**spec)), flush=True)
@@ -0,0 +1,101 @@
+# video_source.py
+import time
+
+import cv2
+
+# Strides at least this long are cheaper to seek over than to grab through
+SEEK_STRIDE_FRAMES = 30
+
+
+class VideoReader:
+    """``cv2.VideoCapture`` wrapper that only decodes the frames we look at.
+
+    The start offset is reached with a timestamp seek (the backend jumps to the
+    nearest keyframe) instead of decoding every lead-in frame. Between sampled
+    frames, short gaps are skipped with ``grab()`` (no retrieve/colour convert)
+    and long gaps with another seek. Reading stops at ``end_s`` or at the first
+    failed read. Exposes the ``read``/``isOpened``/``release``/``get`` subset of
+    the capture API, so it can be handed to the stream pipeline as-is.
+    ``frame_ms`` is the timestamp of the frame ``read`` last returned; the
+    capture itself is already a stride further on by then.
+    """
+
+    def __init__(self, path, start_s=0.0, end_s=None, stride=1):
+        self.cap = cv2.VideoCapture(str(path))
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30  # fallback to 30 if unavailable
+        frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        self.stride = max(1, int(stride))
+        self.start_frame = max(0, int(round(start_s * self.fps)))
+        self.end_frame = int(round(end_s * self.fps)) if end_s else (frame_count or None)
+
+        self.position = 0       # index of the next frame the capture will return
+        self.decoded = 0        # frames fully decoded and returned
+        self.grabbed = 0        # frames skipped with grab()
+        self.seeks = 0
+        self.frame_ms = 0.0
+        self._finished = False
+        self._started = time.monotonic()
+
+        if self.start_frame:
+            self._seek(self.start_frame)
+
+    def _seek(self, frame):
+        if self.cap.set(cv2.CAP_PROP_POS_MSEC, frame * 1000.0 / self.fps):
+            self.seeks += 1
+            self.position = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES) or frame)
+            return
+        # backend can't seek: fall back to grabbing our way there
+        self._grab(frame - self.position)
+
+    def _grab(self, n):
+        for _ in range(n):
+            if self._past_end() or not self.cap.grab():
+                self._finished = True
+                return
+            self.position += 1
+            self.grabbed += 1
+
+    def _past_end(self):
+        return self.end_frame is not None and self.position >= self.end_frame
+
+    def read(self):
+        if self._finished or self._past_end():
+            return False, None
+        success, frame = self.cap.read()
+        if not success:
+            self._finished = True
+            return False, None
+        # before skipping ahead: afterwards the capture reports the next sampled frame
+        self.frame_ms = self.cap.get(cv2.CAP_PROP_POS_MSEC) or self.position * 1000.0 / self.fps
+        self.position += 1
+        self.decoded += 1
+
+        gap = self.stride - 1
+        if gap >= SEEK_STRIDE_FRAMES:
+            self._seek(self.position + gap)
+        elif gap:
+            self._grab(gap)
+        return True, frame
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return self.frame_ms
+        return self.cap.get(prop)
+
+    def release(self):
+        self.cap.release()
+
+    def stats(self):
+        elapsed = max(time.monotonic() - self._started, 1e-6)
+        covered = max(self.position - self.start_frame, 0) / self.fps
+        return {
+            "decoded": self.decoded,
+            "grabbed": self.grabbed,
+            "seeks": self.seeks,
+            "decode_fps": self.decoded / elapsed,
+            # seconds of footage covered per wall-clock second
+            "speed": covered / elapsed,
+        }